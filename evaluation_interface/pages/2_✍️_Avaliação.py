@@ -1,6 +1,9 @@
+import random
+
 import polars as pl
 import streamlit as st
-from utils import get_results_path, load_config, load_data
+from utils import (export_results, load_config, load_headline_index,
+                   load_results, save_results)
 from streamlit.components.v1 import html
 
 if "username" not in st.session_state or st.session_state.username is None:
@@ -12,29 +15,21 @@ username = st.session_state.username
 cfg = load_config()
 splits = cfg["splits"]
 
-results_path = get_results_path(username)
-results_path.parent.mkdir(parents=True, exist_ok=True)
-
-df = load_data().filter(pl.col("headline_id").is_in(splits[username]))
+headline_index = load_headline_index()
 
 
 def format_headline():
-    cur_headline = st.session_state.cur_headline
-    return df.filter(pl.col("headline_id") == cur_headline)["headline"].first()
+    return headline_index[st.session_state.cur_headline]["headline"]
 
 
 def update_jokes():
     cur_headline = st.session_state.cur_headline
-    if ("results_df" in st.session_state and
-        cur_headline in st.session_state.results_df["headline_id"]):
-        jokes = (st.session_state.results_df
-                 .filter(pl.col("headline_id") == cur_headline)["generated"]
-                 .to_list())
+    if cur_headline in st.session_state.rates:
+        # Keep the order in which the jokes were rated
+        jokes = list(st.session_state.rates[cur_headline])
     else:
-        jokes = (df.filter(pl.col("headline_id") == cur_headline)["generated"]
-                 .unique()
-                 .sample(fraction=1, shuffle=True)
-                 .to_list())
+        jokes = headline_index[cur_headline]["jokes"]
+        jokes = random.sample(jokes, len(jokes))
     st.session_state.cur_jokes = jokes
 
 
@@ -57,17 +52,37 @@ def increase_index():
 
 
 def set_show_success():
+    export_results(username)
     st.session_state.show_success = True
 
 
 def update_rates():
+    cur_headline = st.session_state.cur_headline
     jokes = {}
     for i in range(len(st.session_state.cur_jokes)):
-        fun = st.session_state[f"funniness_{st.session_state.cur_headline}_{i}"]
-        rel = st.session_state[f"relation_{st.session_state.cur_headline}_{i}"]
+        fun = st.session_state[f"funniness_{cur_headline}_{i}"]
+        rel = st.session_state[f"relation_{cur_headline}_{i}"]
         jokes[st.session_state.cur_jokes[i]] = {"funniness": fun, "relation": rel}
 
-    st.session_state.rates[st.session_state.cur_headline] = jokes
+    previous = st.session_state.rates.get(cur_headline, {})
+    changed = [joke for joke in jokes if previous.get(joke) != jokes[joke]]
+    st.session_state.rates[cur_headline] = jokes
+    if changed:
+        save_rates(cur_headline, changed)
+
+
+def save_rates(headline_id, changed):
+    """Persist only the changed ratings."""
+    rates = st.session_state.rates[headline_id]
+    rates_df = pl.DataFrame({"evaluator": [username] * len(changed),
+                             "headline_id": [headline_id] * len(changed),
+                             "generated": changed,
+                             "funniness": [rates[j]["funniness"] for j in changed],
+                             "relation": [rates[j]["relation"] for j in changed]})
+    rates_df = headline_index[headline_id]["rows"].join(rates_df,
+                                                        on=["headline_id",
+                                                            "generated"])
+    save_results(rates_df)
 
 
 #
@@ -75,9 +90,7 @@ def update_rates():
 #
 if "rates" not in st.session_state:
     st.session_state.rates = {}
-if "results_df" not in st.session_state and results_path.exists():
-    st.session_state.results_df = pl.read_ndjson(results_path)
-    for row in st.session_state.results_df.iter_rows(named=True):
+    for row in load_results(username).iter_rows(named=True):
         if row["headline_id"] not in st.session_state.rates:
             st.session_state.rates[row["headline_id"]] = {}
         st.session_state.rates[row["headline_id"]][row["generated"]] = {
@@ -185,25 +198,3 @@ with btn_col2:
     else:
         st.button("Concluir", type="primary", on_click=set_show_success,
                   use_container_width=True)
-
-#
-# ------ Consolidate and save results ------
-#
-if st.session_state.rates and st.session_state.cur_headline in st.session_state.rates:
-    rates = {"evaluator": [], "headline_id": [], "generated": [], "funniness": [], "relation": []}
-    for headline_id in st.session_state.rates:
-        for generated in st.session_state.rates[headline_id]:
-            rates["evaluator"].append(username)
-            rates["headline_id"].append(headline_id)
-            rates["generated"].append(generated)
-            rates["funniness"].append(st.session_state.rates[headline_id][generated]["funniness"])
-            rates["relation"].append(st.session_state.rates[headline_id][generated]["relation"])
-    rates_df = pl.DataFrame(rates)
-    rates_df = df.join(rates_df, on=["headline_id", "generated"])
-    if "results_df" in st.session_state:
-        rates_df = (st.session_state.results_df.update(rates_df,
-                                                       on=["headline_id",
-                                                           "generated"],
-                                                       how="full"))
-    st.session_state.results_df = rates_df
-    st.session_state.results_df.write_ndjson(results_path)
@@ -1,2 +1,3 @@
-from .resources import (get_results_path, load_config, load_data)
-
+from .resources import (export_results, get_results_path, get_results_store,
+                        load_config, load_data, load_headline_index,
+                        load_results, save_results)
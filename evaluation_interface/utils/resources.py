@@ -3,6 +3,7 @@ from pathlib import Path
 import polars as pl
 import streamlit as st
 import yaml
+from full_pun_generation.ratings import RatingsStore
 
 INTERFACE_ROOT = Path(__file__).parent.parent.resolve()
 
@@ -18,8 +19,51 @@ def load_data():
     return pl.read_ndjson(data_path)
 
 
+@st.cache_resource
+def load_headline_index():
+    """
+    Map each headline_id to its headline, its unique jokes and its rows,
+    built once and shared by every session.
+    """
+    index = dict()
+    for (headline_id,), rows in load_data().partition_by("headline_id",
+                                                         as_dict=True).items():
+        index[headline_id] = {"headline": rows["headline"].first(),
+                              "jokes": rows["generated"].unique(maintain_order=True).to_list(),
+                              "rows": rows}
+    return index
+
+
 def get_results_path(username):
     cfg = load_config()
     results_path = INTERFACE_ROOT / cfg["paths"]["results"] / f"{username}.jsonl"
     results_path.parent.mkdir(parents=True, exist_ok=True)
     return results_path
+
+
+@st.cache_resource
+def get_results_store():
+    """
+    Ratings of every evaluator, shared by all sessions. Existing JSONL
+    results are imported the first time the store is created.
+    """
+    cfg = load_config()
+    results_path = INTERFACE_ROOT / cfg["paths"]["results"]
+    store = RatingsStore(results_path / "results.db")
+    if store.is_empty():
+        store.import_jsonl(results_path)
+    return store
+
+
+def load_results(username):
+    return get_results_store().query(evaluator=username)
+
+
+def save_results(rows):
+    """Insert or update the given ratings."""
+    get_results_store().upsert(rows)
+
+
+def export_results(username):
+    """Write the evaluator ratings to its JSONL results file."""
+    get_results_store().export_jsonl(get_results_path(username).parent, username)
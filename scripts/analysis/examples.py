@@ -2,6 +2,7 @@ from pathlib import Path
 
 import polars as pl
 import yaml
+from full_pun_generation.ratings import load_results
 
 fun_order = ["Não tem piada", "Tem pouca piada", "Tem piada"]
 rel_order = ["Não tem relação", "Tem pouca relação", "Tem relação"]
@@ -12,8 +13,8 @@ model_names = {"deepseek-r1-70b": "Deepseek",
                "_fewshot": "+shot"}
 
 results_path = Path("results/evaluation")
-dfs = [pl.read_ndjson(f) for f in results_path.glob("*.jsonl")]
-df = (pl.concat(dfs)
+df = load_results(results_path)
+df = (df
       .select([pl.col("evaluator"),
                pl.col("model").str.replace_many(model_names),
                pl.col("headline_id"),
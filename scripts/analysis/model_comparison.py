@@ -0,0 +1,79 @@
+from argparse import ArgumentParser
+from pathlib import Path
+from time import perf_counter
+
+import polars as pl
+import yaml
+from full_pun_generation.ratings import load_results
+from full_pun_generation.stats import compare_groups, group_scores
+
+fun_order = ["Não tem piada", "Tem pouca piada", "Tem piada"]
+rel_order = ["Não tem relação", "Tem pouca relação", "Tem relação"]
+model_names = {"deepseek-r1-70b": "Deepseek",
+               "llama3-3": "Llama3.3",
+               "ptt5-v2": "PTT5",
+               "_definitions": "+def",
+               "_fewshot": "+shot"}
+
+
+def parse_args():
+    parser = ArgumentParser(description="Pairwise significance of the differences "
+                                        "in funniness and relation between models")
+    parser.add_argument("-n", "--n_resamples", type=int, default=10000)
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="Save the significance table as CSV")
+    return parser.parse_args()
+
+
+def load_ratings(results_path=Path("results/evaluation")):
+    df = load_results(results_path)
+    df = df.select(pl.col("evaluator"),
+                   pl.col("model").str.replace_many(model_names),
+                   pl.col("headline_id"),
+                   pl.col("funniness"),
+                   pl.col("relation"))
+
+    # Headlines an evaluator passed through without changing the default
+    # evaluation were not recorded (see evaluation_analysis.py)
+    splits_path = Path("evaluation_interface/config/config.yaml")
+    splits = yaml.safe_load(splits_path.read_text())["splits"]
+    splits_df = (pl.DataFrame([{"evaluator": evaluator, "headline_id": headline_ids}
+                               for evaluator, headline_ids in splits.items()
+                               if evaluator in df["evaluator"].unique()])
+                 .explode("headline_id"))
+    missing_df = (splits_df.join(df.select("model").unique(), how="cross")
+                  .join(df, on=["evaluator", "headline_id", "model"], how="anti")
+                  .with_columns(pl.lit("Não tem piada").alias("funniness"),
+                                pl.lit("Não tem relação").alias("relation"))
+                  .select(df.columns))
+    return (df.extend(missing_df)
+            .with_columns(pl.col("funniness").cast(pl.Enum(fun_order)).to_physical() + 1,
+                          pl.col("relation").cast(pl.Enum(rel_order)).to_physical() + 1))
+
+
+def main(args):
+    df = load_ratings()
+    tables = list()
+    start = perf_counter()
+    for criterion in ["funniness", "relation"]:
+        scores, models, headlines = group_scores(df, criterion)
+        print(f"{criterion}: {len(models)} models, {len(headlines)} paired headlines")
+        tables.append(compare_groups(scores, models, args.n_resamples,
+                                     args.confidence, args.seed, args.workers)
+                      .select(pl.lit(criterion).alias("criterion"), pl.all()))
+    table = pl.concat(tables)
+    print(f"{args.n_resamples} resamples in {perf_counter() - start:.2f}s\n")
+
+    print("###### Model comparison ######")
+    print(table.write_csv(float_precision=4))
+    if args.output:
+        args.output.parent.mkdir(exist_ok=True, parents=True)
+        table.write_csv(args.output)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
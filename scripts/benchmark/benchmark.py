@@ -0,0 +1,327 @@
+import json
+import platform
+import re
+import subprocess
+import sys
+import time
+from argparse import SUPPRESS, ArgumentParser
+from pathlib import Path
+from statistics import mean, median
+
+import polars as pl
+
+import stubs
+
+# Pun and alternative signs from the Puntuguese few-shot examples
+PUNTUGUESE_SIGNS = ["entre-meada", "entre miada", "flora", "shanti-lee",
+                    "chantilly", "paciente"]
+
+
+def parse_args(argv=None):
+    parser = ArgumentParser()
+    parser.add_argument("--mode",
+                        help="Warm: time repeated calls in one process. " +
+                        "Cold: time import, setup and first call in a fresh process.",
+                        choices=["warm", "cold"], default="warm")
+    parser.add_argument("--stub",
+                        help="Replace network/GPU models with deterministic stubs.",
+                        action="store_true")
+    parser.add_argument("--benchmarks", "-b",
+                        help="Benchmarks to run (default: all).",
+                        nargs="+", default=None)
+    parser.add_argument("--repeat", "-r",
+                        help="Number of timed runs per benchmark.",
+                        type=int, default=5)
+    parser.add_argument("--n_words",
+                        help="Number of words sampled from the ignore list.",
+                        type=int, default=30)
+    parser.add_argument("--n_headlines",
+                        help="Number of headlines used by context benchmarks.",
+                        type=int, default=10)
+    parser.add_argument("--batch_sizes",
+                        help="Batch sizes for T5 generation.",
+                        nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--max_new_tokens",
+                        help="Maximum new tokens for T5 generation.",
+                        type=int, default=64)
+    parser.add_argument("--output", "-o",
+                        help="Where to save the results (default: results/benchmark/<mode>.json).",
+                        type=Path, default=None)
+    parser.add_argument("--baseline",
+                        help="Stored results to compare against.",
+                        type=Path, default=None)
+    parser.add_argument("--threshold",
+                        help="Relative slowdown reported as a regression.",
+                        type=float, default=0.1)
+    parser.add_argument("--single",
+                        help=SUPPRESS,
+                        type=str, default=None)
+    return parser.parse_args(argv)
+
+
+#
+# ------ Workloads ------
+#
+def load_headlines(n):
+    return (pl.read_ndjson("data/headlines.jsonl")["headline"]
+            .head(n).to_list())
+
+
+def load_words(n):
+    """
+    Deterministic sample of validated words plus the Puntuguese signs and
+    the signs already found for the bundled headlines.
+    """
+    lines = Path("data/ignore_pron_words.txt").read_text().splitlines()
+    words = [line.strip() for line in lines
+             if line.strip() and not line.startswith("#")]
+    step = max(1, len(words) // n)
+    sample = words[::step][:n]
+
+    signs = (pl.read_ndjson("data/processed_headlines.jsonl")
+             .select(pl.concat_list("pun sign", "alternative sign"))
+             .to_series().explode().drop_nulls().unique(maintain_order=True)
+             .to_list())
+    return list(dict.fromkeys(sample + PUNTUGUESE_SIGNS + signs))
+
+
+def load_prompts():
+    """Puntuguese-formatted prompts for the processed headlines."""
+    return (pl.read_ndjson("data/processed_headlines.jsonl")
+            .select(pl.concat_str([pl.lit("Gerar trocadilho: "),
+                                   pl.col("pun sign"),
+                                   pl.lit(" / "),
+                                   pl.col("alternative sign")]))
+            .to_series().drop_nulls().to_list())
+
+
+#
+# ------ Benchmarks ------
+# Each setup function does the untimed preparation and returns
+# the callable to be timed.
+#
+def setup_get_pronunciation(args):
+    from full_pun_generation.pronunciation import get_pronunciation
+    words = load_words(args.n_words)
+    return lambda: get_pronunciation(words)
+
+
+def setup_phoneme_to_grapheme(args):
+    from full_pun_generation.pronunciation import (get_pronunciation,
+                                                   phoneme_to_grapheme)
+    prons = [p for p in get_pronunciation(load_words(args.n_words)) if p]
+
+    def run():
+        for pron in prons:
+            phoneme_to_grapheme(pron)
+    return run
+
+
+def setup_generate_all_possibilities(args):
+    from full_pun_generation.pronunciation import (encode_pronunciation,
+                                                   generate_all_possibilities,
+                                                   get_graphemes,
+                                                   get_pronunciation)
+    prons = [p for p in get_pronunciation(load_words(args.n_words)) if p]
+    graphemes = [get_graphemes(encode_pronunciation(pron)) for pron in prons]
+
+    def run():
+        for g in graphemes:
+            generate_all_possibilities(g)
+    return run
+
+
+def setup_ranked_possibilities(args):
+    from full_pun_generation.pronunciation import (encode_pronunciation,
+                                                   get_graphemes,
+                                                   get_pronunciation,
+                                                   get_spelling_model,
+                                                   ranked_possibilities)
+    get_spelling_model()
+    prons = [p for p in get_pronunciation(load_words(args.n_words)) if p]
+    graphemes = [get_graphemes(encode_pronunciation(pron)) for pron in prons]
+
+    def run():
+        for g in graphemes:
+            ranked_possibilities(g)
+    return run
+
+
+def setup_get_ambiguous_words(args):
+    from full_pun_generation.wordnet import get_ambiguous_words
+    words = load_words(args.n_words)
+    return lambda: get_ambiguous_words(words)
+
+
+def setup_extract_keywords(args):
+    from full_pun_generation.context import extract_keywords
+    headlines = load_headlines(args.n_headlines)
+
+    def run():
+        for headline in headlines:
+            extract_keywords(headline)
+    return run
+
+
+def setup_expand_keywords(args):
+    from full_pun_generation.context import expand_keywords, extract_keywords
+    keywords = [extract_keywords(h) for h in load_headlines(args.n_headlines)]
+
+    def run():
+        for kws in keywords:
+            expand_keywords(kws)
+    return run
+
+
+def setup_t5_generate(args, batch_size):
+    from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+    device = "cpu"
+    if not args.stub:
+        import torch
+        device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    tokenizer = AutoTokenizer.from_pretrained("unicamp-dl/ptt5-v2-base",
+                                              legacy=True)
+    tokenizer.pad_token = tokenizer.eos_token
+    model = T5ForConditionalGeneration.from_pretrained("Superar/ptt5-v2-pun-generation",
+                                                       subfolder="ptt5-v2-words",
+                                                       device_map=device)
+    prompts = load_prompts()
+
+    def run():
+        for i in range(0, len(prompts), batch_size):
+            batch = tokenizer(prompts[i:i + batch_size], truncation=True,
+                              padding="max_length", max_length=512,
+                              return_tensors=None if args.stub else "pt")
+            if not args.stub:
+                batch = {k: v.to(device) for k, v in batch.items()}
+            output = model.generate(input_ids=batch["input_ids"],
+                                    attention_mask=batch["attention_mask"],
+                                    max_new_tokens=args.max_new_tokens)
+            tokenizer.batch_decode(output, skip_special_tokens=True)
+    return run
+
+
+def get_benchmarks(args):
+    benchmarks = {"get_pronunciation": setup_get_pronunciation,
+                  "phoneme_to_grapheme": setup_phoneme_to_grapheme,
+                  "generate_all_possibilities": setup_generate_all_possibilities,
+                  "ranked_possibilities": setup_ranked_possibilities,
+                  "get_ambiguous_words": setup_get_ambiguous_words,
+                  "extract_keywords": setup_extract_keywords,
+                  "expand_keywords": setup_expand_keywords}
+    for bs in args.batch_sizes:
+        benchmarks[f"t5_generate[bs={bs}]"] = (
+            lambda a, bs=bs: setup_t5_generate(a, bs))
+    return benchmarks
+
+
+#
+# ------ Runners ------
+#
+def install_stubs(args):
+    vocabulary = load_words(args.n_words)
+    for headline in load_headlines(args.n_headlines):
+        vocabulary += re.findall(r"\w+", headline.lower())
+    stubs.install(vocabulary)
+
+
+def summarize(runs):
+    return {"median": median(runs), "min": min(runs),
+            "mean": mean(runs), "runs": runs}
+
+
+def run_warm(name, setup, args):
+    func = setup(args)
+    func()  # Warm-up call, fills lazy loaders and caches
+    runs = list()
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+    return summarize(runs)
+
+
+def run_single_cold(name, args):
+    """Time setup and first call, including imports and model loading."""
+    start = time.perf_counter()
+    if args.stub:
+        install_stubs(args)
+    func = get_benchmarks(args)[name](args)
+    func()
+    return time.perf_counter() - start
+
+
+def run_cold(name, setup, args):
+    runs = list()
+    argv = sys.argv[1:]
+    for _ in range(args.repeat):
+        output = subprocess.run([sys.executable, __file__, *argv,
+                                 "--single", name],
+                                check=True, capture_output=True, text=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1])["seconds"])
+    return summarize(runs)
+
+
+def compare(results, baseline, threshold):
+    print(f"\n###### Comparison with {baseline['path']} ######")
+    print(f"{'benchmark':<30}{'baseline':>12}{'current':>12}{'change':>10}")
+    regressions = list()
+    for name, current in results["results"].items():
+        if name not in baseline["results"]:
+            print(f"{name:<30}{'-':>12}{current['median']:>12.4f}{'new':>10}")
+            continue
+        base = baseline["results"][name]["median"]
+        change = (current["median"] - base) / base
+        flag = ""
+        if change > threshold:
+            flag = " REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            flag = " faster"
+        print(f"{name:<30}{base:>12.4f}{current['median']:>12.4f}" +
+              f"{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(args):
+    if args.single:
+        print(json.dumps({"seconds": run_single_cold(args.single, args)}))
+        return
+
+    if args.stub and args.mode == "warm":
+        install_stubs(args)
+
+    benchmarks = get_benchmarks(args)
+    names = args.benchmarks or list(benchmarks)
+    runner = run_warm if args.mode == "warm" else run_cold
+    results = {"mode": args.mode, "stub": args.stub,
+               "python": platform.python_version(),
+               "machine": platform.machine(),
+               "repeat": args.repeat, "results": {}}
+    for name in names:
+        print(f"Running {name} ({args.mode})")
+        results["results"][name] = runner(name, benchmarks[name], args)
+        print(f"  median: {results['results'][name]['median']:.4f}s")
+
+    savepath = args.output or Path(f"results/benchmark/{args.mode}.json")
+    if args.stub and args.output is None:
+        savepath = savepath.with_stem(savepath.stem + "_stub")
+    savepath.parent.mkdir(exist_ok=True, parents=True)
+    savepath.write_text(json.dumps(results, indent=2))
+    print(f"Saved {savepath}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        baseline["path"] = args.baseline
+        if (baseline["mode"], baseline["stub"]) != (args.mode, args.stub):
+            print("Warning: baseline was recorded with " +
+                  f"mode={baseline['mode']}, stub={baseline['stub']}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,116 @@
+"""
+Load test of the pun-generation service (`python -m full_pun_generation.service`).
+
+Headlines are sent by a fixed number of concurrent clients, drawn from the
+first `--distinct` headlines so that some are repeated (as the same news
+reaches several readers). Streamed responses are used to time both the
+signs (first event) and the complete answer, and their p50/p95/p99
+latencies are reported.
+"""
+import asyncio
+import json
+import random
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import httpx
+import numpy as np
+import polars as pl
+
+
+def parse_args():
+    parser = ArgumentParser(description="Load test the pun-generation service")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--distinct", type=int, default=50,
+                        help="Number of different headlines sent")
+    parser.add_argument("--max_jokes", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="Client timeout of each request, in seconds")
+    parser.add_argument("--headlines", type=Path, default=Path("data/headlines.jsonl"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="Save the latencies of each request as CSV")
+    return parser.parse_args()
+
+
+async def send(client, url, headline, max_jokes):
+    start = time.perf_counter()
+    result = {"headline": headline, "signs (s)": None, "total (s)": None,
+              "jokes": 0, "timeouts": 0, "error": None}
+    try:
+        async with client.stream("POST", f"{url}/puns",
+                                 json={"headline": headline, "max_jokes": max_jokes,
+                                       "stream": True}) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["event"] == "signs":
+                    result["signs (s)"] = time.perf_counter() - start
+                elif event["event"] == "joke":
+                    result["jokes"] += 1
+                elif event["event"] == "timeout":
+                    result["timeouts"] += 1
+        result["total (s)"] = time.perf_counter() - start
+    except httpx.HTTPError as e:
+        result["error"] = repr(e)
+    return result
+
+
+async def run(args, headlines):
+    queue = asyncio.Queue()
+    for headline in headlines:
+        queue.put_nowait(headline)
+    results = list()
+
+    async def client_loop(client):
+        while not queue.empty():
+            headline = queue.get_nowait()
+            results.append(await send(client, args.url, headline, args.max_jokes))
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        stats = (await client.get(f"{args.url}/stats")).json()
+    return results, elapsed, stats
+
+
+def summarize(latencies):
+    latencies = np.array([x for x in latencies if x is not None])
+    if not len(latencies):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"count": len(latencies), "mean": latencies.mean(),
+            "p50": p50, "p95": p95, "p99": p99, "max": latencies.max()}
+
+
+def main(args):
+    all_headlines = pl.read_ndjson(args.headlines)["headline"].unique(maintain_order=True)
+    rng = random.Random(args.seed)
+    headlines = rng.choices(all_headlines[:args.distinct].to_list(), k=args.requests)
+
+    results, elapsed, stats = asyncio.run(run(args, headlines))
+    df = pl.DataFrame(results)
+    print(f"{len(results)} requests in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.2f} requests/s, {args.concurrency} clients)")
+    print(f"Errors: {df['error'].is_not_null().sum()}, "
+          f"timeouts: {df['timeouts'].sum()}, jokes: {df['jokes'].sum()}, "
+          f"coalesced: {stats['coalesced']}")
+    print(pl.DataFrame([{"latency": name, **summarize(df[column].to_list())}
+                        for name, column in [("signs", "signs (s)"),
+                                             ("total", "total (s)")]]))
+    with pl.Config(tbl_cols=-1, tbl_width_chars=250):
+        print(pl.DataFrame(stats["signs"] + stats["generation"]))
+    if args.output:
+        args.output.parent.mkdir(exist_ok=True, parents=True)
+        df.write_csv(args.output)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
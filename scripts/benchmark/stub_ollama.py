@@ -0,0 +1,122 @@
+"""
+Local stand-ins for Ollama servers, to exercise the dispatcher of
+`generate_ollama_jokes.py` without GPUs. Each port serves /api/tags and a
+streamed /api/generate that answers with a fixed joke after a delay per
+token; some servers can be made to fail or to go down after a while.
+
+    python scripts/benchmark/stub_ollama.py --ports 11435 11436 11437 --fail_ports 11437
+    python scripts/generation/generate_ollama_jokes.py --ollama_url \\
+        http://localhost:11435 http://localhost:11436 http://localhost:11437
+"""
+import json
+import random
+import threading
+import time
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+answer = ("<think>\nUm trocadilho com as palavras.\n</think>\n"
+          "{\"palavras\": [\"flora\", \"flora\"], "
+          "\"trocadilho\": \"Foi lançada uma nova manteiga. Chama-se Flora Intestinal.\"}"
+          "\nEspero que goste!")
+
+
+def parse_args():
+    parser = ArgumentParser(description="Serve stub Ollama APIs on local ports")
+    parser.add_argument("--ports", type=int, nargs="+", default=[11435])
+    parser.add_argument("--token_delay", type=float, default=0.01,
+                        help="Seconds to generate each token")
+    parser.add_argument("--slow_ports", type=int, nargs="*", default=[],
+                        help="Ports whose servers are 4 times slower")
+    parser.add_argument("--fail_ports", type=int, nargs="*", default=[],
+                        help="Ports whose servers fail a fraction of the generations")
+    parser.add_argument("--fail_rate", type=float, default=0.3)
+    parser.add_argument("--down_after", type=float, default=None,
+                        help="Seconds after which the failing servers stop answering")
+    return parser.parse_args()
+
+
+def tokens(text):
+    return [text[i:i+4] for i in range(0, len(text), 4)]
+
+
+def make_handler(args, port):
+    token_delay = args.token_delay * (4 if port in args.slow_ports else 1)
+    failing = port in args.fail_ports
+    start = time.monotonic()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *log_args):
+            pass
+
+        def down(self):
+            return (failing and args.down_after is not None
+                    and time.monotonic() - start > args.down_after)
+
+        def send_json(self, status, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.down():
+                return self.send_json(503, {"error": "down"})
+            if self.path == "/api/tags":
+                return self.send_json(200, {"models": [{"name": "stub"}]})
+            self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path != "/api/generate":
+                return self.send_json(404, {"error": "not found"})
+            if self.down() or (failing and random.random() < args.fail_rate):
+                return self.send_json(500, {"error": "stub failure"})
+
+            model = request.get("model", "stub")
+            chunks = tokens(answer)
+            if not request.get("stream", True):
+                time.sleep(token_delay * len(chunks))
+                return self.send_json(200, {"model": model, "response": answer, "done": True,
+                                            "created_at": datetime.now(timezone.utc).isoformat(),
+                                            "eval_count": len(chunks)})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            try:
+                for i, chunk in enumerate(chunks + [""]):
+                    time.sleep(token_delay)
+                    done = i == len(chunks)
+                    line = {"model": model, "response": chunk, "done": done,
+                            "created_at": datetime.now(timezone.utc).isoformat()}
+                    if done:
+                        line.update(done_reason="stop", eval_count=len(chunks))
+                    self.wfile.write(json.dumps(line).encode("utf-8") + b"\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client cancelled the generation
+                pass
+
+    return Handler
+
+
+def main(args):
+    servers = [ThreadingHTTPServer(("localhost", port), make_handler(args, port))
+               for port in args.ports]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Stub Ollama on http://localhost:{server.server_port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args)
@@ -0,0 +1,174 @@
+"""
+Lightweight stand-ins for the network/GPU models used by the pipeline.
+
+They are installed into `sys.modules` before `full_pun_generation` is
+imported, so the benchmarks can run offline. Outputs are deterministic
+(hash-based) but meaningless: they only exercise the surrounding code.
+"""
+import hashlib
+import re
+import sys
+import types
+
+import numpy as np
+
+EMBEDDING_DIM = 384
+
+
+def _seed(text):
+    return int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:4], "little")
+
+
+def _tokens(text):
+    return re.findall(r"\w+", text.lower())
+
+
+class SentenceTransformer:
+    def __init__(self, model_name_or_path=None, *args, **kwargs):
+        self.model_name = model_name_or_path
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        embeddings = np.stack([np.random.default_rng(_seed(s))
+                               .standard_normal(EMBEDDING_DIM)
+                               .astype(np.float32)
+                               for s in sentences])
+        return embeddings[0] if single else embeddings
+
+    def similarity(self, embeddings1, embeddings2):
+        a = np.atleast_2d(embeddings1)
+        b = np.atleast_2d(embeddings2)
+        a = a / np.linalg.norm(a, axis=1, keepdims=True)
+        b = b / np.linalg.norm(b, axis=1, keepdims=True)
+        return a @ b.T
+
+
+class KeyBERT:
+    def __init__(self, model=None):
+        self.model = model
+
+    def extract_keywords(self, text, top_n=5, stop_words=None, **kwargs):
+        stop_words = set(stop_words or [])
+        candidates = dict.fromkeys(w for w in _tokens(text)
+                                   if w not in stop_words and not w.isdigit())
+        scored = [(w, (_seed(w) % 1000) / 1000) for w in candidates]
+        return sorted(scored, key=lambda x: x[1], reverse=True)[:top_n]
+
+
+class KeyedVectors:
+    vocabulary = list()
+
+    def __init__(self, vocabulary):
+        self.vocabulary = sorted(set(vocabulary))
+
+    @classmethod
+    def load(cls, path, *args, **kwargs):
+        return cls(cls.vocabulary)
+
+    def __contains__(self, word):
+        return word in self.vocabulary
+
+    @property
+    def key_to_index(self):
+        return {w: i for i, w in enumerate(self.vocabulary)}
+
+    @property
+    def index_to_key(self):
+        return self.vocabulary
+
+    def get_normed_vectors(self):
+        vectors = np.stack([np.random.default_rng(_seed(w)).standard_normal(EMBEDDING_DIM)
+                            for w in self.vocabulary]).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    def most_similar(self, word, topn=10):
+        rng = np.random.default_rng(_seed(word))
+        candidates = [w for w in self.vocabulary if w != word]
+        idx = rng.permutation(len(candidates))[:topn]
+        return [(candidates[i], float(1 - j / (topn + 1)))
+                for j, i in enumerate(idx)]
+
+
+class _TokenClassificationPipeline:
+    def __call__(self, texts, batch_size=None, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        outputs = [[{"word": w, "entity": "NOUN" if len(w) > 3 else "DET"}
+                    for w in re.findall(r"\w+", text)]
+                   for text in texts]
+        return outputs[0] if single else outputs
+
+
+class _TextClassificationPipeline:
+    def __call__(self, texts, batch_size=None, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+        outputs = [{"label": "LABEL_1", "score": (_seed(t) % 1000) / 1000}
+                   for t in texts]
+        return outputs[0] if single else outputs
+
+
+def pipeline(task, model=None, *args, **kwargs):
+    if task in {"ner", "token-classification"}:
+        return _TokenClassificationPipeline()
+    return _TextClassificationPipeline()
+
+
+class AutoTokenizer:
+    eos_token = "</s>"
+    pad_token = None
+
+    @classmethod
+    def from_pretrained(cls, *args, **kwargs):
+        return cls()
+
+    def __call__(self, texts, max_length=512, **kwargs):
+        input_ids = [[_seed(t) % 32000 for t in _tokens(text)][:max_length]
+                     for text in texts]
+        attention_mask = [[1] * len(ids) for ids in input_ids]
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [" ".join(f"tok{i}" for i in seq) for seq in sequences]
+
+
+class T5ForConditionalGeneration:
+    @classmethod
+    def from_pretrained(cls, *args, **kwargs):
+        return cls()
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=512,
+                 num_return_sequences=1, **kwargs):
+        return [ids[:max_new_tokens] for ids in input_ids
+                for _ in range(num_return_sequences)]
+
+
+def install(vocabulary=()):
+    """Register the stub modules. Must run before importing the pipeline."""
+    KeyedVectors.vocabulary = sorted(set(vocabulary))
+
+    sentence_transformers = types.ModuleType("sentence_transformers")
+    sentence_transformers.SentenceTransformer = SentenceTransformer
+
+    keybert = types.ModuleType("keybert")
+    keybert.KeyBERT = KeyBERT
+
+    transformers = types.ModuleType("transformers")
+    transformers.pipeline = pipeline
+    transformers.AutoTokenizer = AutoTokenizer
+    transformers.T5ForConditionalGeneration = T5ForConditionalGeneration
+
+    gensim = types.ModuleType("gensim")
+    gensim_models = types.ModuleType("gensim.models")
+    gensim_models.KeyedVectors = KeyedVectors
+    gensim.models = gensim_models
+
+    sys.modules.update({"sentence_transformers": sentence_transformers,
+                        "keybert": keybert,
+                        "transformers": transformers,
+                        "gensim": gensim,
+                        "gensim.models": gensim_models})
@@ -4,6 +4,7 @@ from pathlib import Path
 
 import polars as pl
 from langchain_ollama import OllamaLLM
+from full_pun_generation.ollama import Dispatcher, stream_generate
 from full_pun_generation.puntuguese import Puntuguese
 from langchain_core.prompts import (
     FewShotChatMessagePromptTemplate, ChatPromptTemplate)
@@ -12,8 +13,11 @@ from langchain_core.prompts import (
 def parse_args():
     parser = ArgumentParser()
     parser.add_argument("--ollama_url",
-                        help="URL to Ollama API.",
-                        required=True, type=str)
+                        help="URLs to Ollama APIs, requests are balanced between them.",
+                        required=True, type=str, nargs="+")
+    parser.add_argument("--max_outstanding",
+                        help="Maximum concurrent requests to each Ollama API.",
+                        required=False, type=int, default=2)
     parser.add_argument("--model",
                         help="Model to run on Ollama.",
                         required=False, type=str,
@@ -24,6 +28,15 @@ def parse_args():
     parser.add_argument("--definitions",
                         help="Run prompt with pun and alternative signs definitions",
                         action="store_true")
+    parser.add_argument("--stream",
+                        help="Stream the generation and stop it once the JSON object is complete.",
+                        action="store_true")
+    parser.add_argument("--reasoning_budget",
+                        help="Maximum reasoning tokens in streaming mode before stopping.",
+                        required=False, type=int, default=None)
+    parser.add_argument("--num_predict",
+                        help="Maximum tokens generated per request.",
+                        required=False, type=int, default=4096)
     return parser.parse_args()
 
 
@@ -71,20 +84,26 @@ def create_prompt(few_shot=False, include_definition=False):
 
 
 def main(args):
-    model = OllamaLLM(base_url=args.ollama_url,
-                      model=args.model,
-                      temperature=0.6, top_p=0.95)
     prompt = create_prompt(few_shot=args.few_shot,
                            include_definition=args.definitions)
-    chain = prompt | model
     print(f"Prompt:\n{prompt}")
 
-    def generate(row):
+    def make_chain(url):
+        model = OllamaLLM(base_url=url,
+                          model=args.model,
+                          temperature=0.6, top_p=0.95,
+                          num_predict=args.num_predict)
+        return prompt | model
+
+    def generate(chain, row):
         prompt_data = {"pun_sign": row["pun sign"],
                        "alt_sign": row["alternative sign"]}
         if args.definitions:
             prompt_data["definition"] = f"\"{row['pun definition']}\" e \"{row['alternative definition']}\""
-        return chain.invoke(prompt_data)
+        if not args.stream:
+            return chain.invoke(prompt_data)
+
+        return stream_generate(chain, prompt_data, args.reasoning_budget, args.num_predict)
 
     model_name = re.sub(r"[:.]", "-", args.model)
     savepath = Path(f"results/generation/{model_name}.jsonl")
@@ -94,15 +113,31 @@ def main(args):
         savepath = savepath.with_stem(savepath.stem + "_definitions")
     savepath.parent.mkdir(exist_ok=True, parents=True)
 
-    df = (pl.read_ndjson("data/processed_headlines.jsonl")
-            .with_columns(
-                pl.struct(pl.col("pun sign"),
-                          pl.col("alternative sign"),
-                          pl.col("pun definition"),
-                          pl.col("alternative definition"))
-                .map_elements(generate, return_dtype=pl.String)
-                .alias("generated"))
-          )
+    # Streamed runs are saved apart, so the full generations are kept
+    if args.stream:
+        savepath = savepath.with_stem(savepath.stem + "_stream")
+
+    generated_dtype = pl.String
+    if args.stream:
+        generated_dtype = pl.Struct({"generated": pl.String,
+                                     "tokens": pl.Int64,
+                                     "reasoning tokens": pl.Int64,
+                                     "stop reason": pl.String,
+                                     "tokens saved": pl.Int64})
+    df = pl.read_ndjson("data/processed_headlines.jsonl")
+    rows = df.select("id", "pun sign", "alternative sign",
+                     "pun definition", "alternative definition").to_dicts()
+    with Dispatcher(args.ollama_url, make_chain, args.max_outstanding) as dispatcher:
+        generated = dispatcher.map(generate, rows)
+        with pl.Config(tbl_cols=-1, tbl_width_chars=250):
+            print(dispatcher.report())
+    df = df.with_columns(pl.Series("generated", generated, dtype=generated_dtype))
+    if args.stream:
+        df = df.unnest("generated")
+        print(df.group_by("stop reason").agg(pl.len(),
+                                             pl.col("tokens").sum(),
+                                             pl.col("reasoning tokens").sum(),
+                                             pl.col("tokens saved").sum()))
     df.write_ndjson(savepath)
     print(f"Saved {savepath}")
 
@@ -1,5 +1,5 @@
 import polars as pl
-from transformers import AutoTokenizer, T5ForConditionalGeneration
+from transformers import AutoTokenizer, T5ForConditionalGeneration, set_seed
 from argparse import ArgumentParser
 from pathlib import Path
 import torch
@@ -14,6 +14,17 @@ parser.add_argument("--input",
 parser.add_argument("--definitions",
                     help="Include word definitions into the prompt",
                     action="store_true")
+parser.add_argument("--candidates",
+                    help="Jokes sampled for each prompt and reranked by headline similarity "
+                         "and typicality (with 1, the greedy joke is generated)",
+                    type=int, default=1)
+parser.add_argument("--top_k",
+                    help="Reranked jokes kept for each prompt",
+                    type=int, default=1)
+parser.add_argument("--batch_size",
+                    help="Prompts in each generate call",
+                    type=int, default=32)
+parser.add_argument("--seed", type=int, default=0)
 args = parser.parse_args()
 
 df = pl.read_ndjson(args.input)
@@ -52,11 +63,36 @@ model_subfolder = "ptt5-v2-descriptions" if args.definitions else "ptt5-v2-words
 model = T5ForConditionalGeneration.from_pretrained("Superar/ptt5-v2-pun-generation",
                                                    subfolder=model_subfolder,
                                                    device_map=device)
-output = model.generate(input_ids=tokenized_prompts["input_ids"].to(device),
-                        attention_mask=tokenized_prompts["attention_mask"].to(device),
-                        max_new_tokens=512)
-decoded_output = tokenizer.batch_decode(output, skip_special_tokens=True)
-decoded_output = pl.Series("generated", decoded_output)
+generation_kwargs = {"max_new_tokens": 512}
+if args.candidates > 1:
+    set_seed(args.seed)
+    generation_kwargs.update(do_sample=True, top_p=0.95,
+                             num_return_sequences=args.candidates)
+decoded_output = list()
+for i in range(0, len(prompts), args.batch_size):
+    output = model.generate(
+        input_ids=tokenized_prompts["input_ids"][i:i+args.batch_size].to(device),
+        attention_mask=tokenized_prompts["attention_mask"][i:i+args.batch_size].to(device),
+        **generation_kwargs)
+    decoded_output.extend(tokenizer.batch_decode(output, skip_special_tokens=True))
+
+# The candidates of each prompt are consecutive in the output
+n_candidates = len(decoded_output) // len(prompts) if prompts else 1
+df = (df.with_row_index("prompt")
+      .select(pl.all().gather([i // n_candidates for i in range(len(decoded_output))]))
+      .with_columns(pl.Series("joke", decoded_output)))
+
+if args.candidates > 1:
+    from full_pun_generation.scoring import score_jokes
+
+    df = df.unique(["prompt", "joke"], keep="first", maintain_order=True)
+    similarity, typicality, score = score_jokes(df["headline"].fill_null(""), df["joke"])
+    df = (df.with_columns(pl.Series("similarity", similarity, dtype=pl.Float64),
+                          pl.Series("typicality", typicality, dtype=pl.Float64),
+                          pl.Series("score", score, dtype=pl.Float64))
+          .sort("prompt", "score", descending=[False, True])
+          .group_by("prompt", maintain_order=True)
+          .head(args.top_k))
 
 df = (df.with_columns(
     pl.concat_str([
@@ -65,12 +101,15 @@ df = (df.with_columns(
         pl.lit("\",\""),
         pl.col("alternative sign"),
         pl.lit("\"],\"trocadilho\":\""),
-        decoded_output,
+        pl.col("joke"),
         pl.lit("\"}")])
     .alias("generated"))
+    .drop("prompt", "joke")
 )
 
 savepath = Path("results/generation/ptt5-v2.jsonl")
+if args.candidates > 1:
+    savepath = savepath.with_stem(savepath.stem + "_rerank")
 if args.definitions:
     savepath = savepath.with_stem(savepath.stem + "_definitions")
 savepath.parent.mkdir(exist_ok=True, parents=True)
@@ -1,29 +1,15 @@
+import random
 from pathlib import Path
 
 import polars as pl
-from full_pun_generation.wordnet import sts_model
-from transformers import pipeline
+from full_pun_generation.results import ingest, scan_results
 
-recognition_model = pipeline(
-    "text-classification", "Superar/pun-recognition-pt")
-results_path = Path("results/generation")
 top_k_models = 2
 top_k_jokes = 1
 num_evaluators = 20
 num_overlaps = 2
 
 
-def semantic_similarity(group):
-    embeddings = sts_model.encode([group["headline"], group["generated"]])
-    similarity = sts_model.similarity(embeddings[0], embeddings[1])
-    return similarity[0]
-
-
-def typicality(puns):
-    prediction = recognition_model(puns.to_list())
-    return pl.Series([p["score"] for p in prediction])
-
-
 def print_info(df, name):
     num_models = df["model"].n_unique()
     num_headlines = df["headline"].n_unique()
@@ -32,24 +18,18 @@ def print_info(df, name):
           f"with {num_inputs} inputs from {num_headlines} headlines")
 
 
-dfs = list()
-for results_filepath in results_path.glob("*.jsonl"):
-    print(f"Loading {results_filepath}")
-    df = (pl.read_ndjson(results_filepath).unique()
-          .with_columns(
-              pl.lit(results_filepath.name).str.strip_suffix(".jsonl")
-              .alias("model"))
-          .select([pl.col("headline"),
-                   pl.col("pun sign"),
-                   pl.col("alternative sign"),
-                   pl.col("model"),
-                   pl.col("generated")
-                   .str.extract(r"\{[^}]+\}", 0)
-                   .str.extract(r"\"trocadilho\":\s?\"(.*)\"", 1)])
-          )
-    dfs.append(df)
+ingest()
+df = (scan_results()
+      .select([pl.col("headline"),
+               pl.col("pun sign"),
+               pl.col("alternative sign"),
+               pl.col("model"),
+               pl.col("generated"),
+               pl.col("similarity"),
+               pl.col("typicality")])
+      .unique()
+      .collect())
 print("**********")
-df = pl.concat(dfs)
 print_info(df, "First load")
 
 # Remove examples with empty signs
@@ -68,16 +48,7 @@ print_info(failed, "Failed generations")
 print_info(df, "After removing failed generations")
 print("**********")
 
-df = (df.filter(pl.col("generated").is_not_null())
-        .with_columns(pl.struct([pl.col("headline"),
-                                 pl.col("generated")])
-                      .map_elements(semantic_similarity,
-                                    return_dtype=pl.Float64)
-                      .alias("similarity"))
-        .with_columns(pl.col("generated")
-                      .map_batches(typicality)
-                      .alias("typicality"))
-      )
+df = df.filter(pl.col("generated").is_not_null())
 
 # Get top models for each criterion
 avg_df = (df.group_by("model")
@@ -116,22 +87,57 @@ df = (pl.concat([top_similarity, top_typicality])
       .with_row_index("id"))
 print_info(df, "After selecting top puns")
 
-# Create evaluation pairs
-pairs = (df.join(df, how="cross")
-         .filter(pl.col("model") != pl.col("model_right"))
-         .filter(pl.col("headline") == pl.col("headline_right"))
-         .filter(pl.col("id") < pl.col("id_right"))
-         .sample(fraction=1.0, shuffle=True))
-print(f"Number of contest pairs: {pairs.height}")
-
-chunk_size = (pairs.height * num_overlaps) // num_evaluators
-chunks = list(pairs.iter_slices(chunk_size))
-print(f"Chunk sizes: {[chunk.height for chunk in chunks]}")
-
-annotator_id = 0
-for _ in range(num_overlaps):
-    for chunk_id, chunk in enumerate(chunks):
-        chunk = chunk.with_columns([pl.lit(annotator_id).alias("annotator_id"),
-                                    pl.lit(chunk_id).alias("chunk_id")])
-        chunk.write_ndjson(f"data/evaluation/annotator_{annotator_id}.jsonl")
-        annotator_id += 1
+# Create evaluation pairs. Puns are only paired within the same headline,
+# so pairs are built one headline at a time, with the columns of a cross
+# join (every column, then every column of the other pun).
+pair_columns = df.columns + [f"{column}_right" for column in df.columns]
+
+
+def headline_pairs(group):
+    return (group.join(group, on="headline", suffix="_right")
+            .filter(pl.col("model") != pl.col("model_right"))
+            .filter(pl.col("id") < pl.col("id_right"))
+            .with_columns(pl.col("headline").alias("headline_right"))
+            .select(pair_columns)
+            .sample(fraction=1.0, shuffle=True))
+
+
+# Pairs of a headline with n puns, n_m of them from model m: (n² - Σ n_m²) / 2
+num_pairs = (df.group_by("headline", "model").len()
+             .group_by("headline")
+             .agg((pl.col("len").sum() ** 2 - (pl.col("len") ** 2).sum()) // 2)
+             ["len"].sum())
+print(f"Number of contest pairs: {num_pairs}")
+
+chunk_size = max(1, (num_pairs * num_overlaps) // num_evaluators)
+num_chunks = -(-num_pairs // chunk_size)
+chunk_sizes = [min(chunk_size, num_pairs - i)
+               for i in range(0, num_pairs, chunk_size)]
+print(f"Chunk sizes: {chunk_sizes}")
+
+evaluation_path = Path("data/evaluation")
+evaluation_path.mkdir(exist_ok=True, parents=True)
+
+
+def write_chunk(chunk, chunk_id):
+    chunk = chunk.sample(fraction=1.0, shuffle=True)
+    for overlap in range(num_overlaps):
+        annotator_id = overlap * num_chunks + chunk_id
+        (chunk.with_columns([pl.lit(annotator_id).alias("annotator_id"),
+                             pl.lit(chunk_id).alias("chunk_id")])
+         .write_ndjson(evaluation_path / f"annotator_{annotator_id}.jsonl"))
+
+
+# Headlines are visited in random order and their shuffled pairs fill the
+# chunks, each written to its overlapping annotators as soon as it is full
+headlines = df.partition_by("headline")
+random.shuffle(headlines)
+pending, chunk_id = list(), 0
+for group in headlines:
+    pending.append(headline_pairs(group))
+    while sum(pairs.height for pairs in pending) >= chunk_size:
+        pairs = pl.concat(pending)
+        write_chunk(pairs.head(chunk_size), chunk_id)
+        pending, chunk_id = [pairs.slice(chunk_size)], chunk_id + 1
+if sum(pairs.height for pairs in pending):
+    write_chunk(pl.concat(pending), chunk_id)
@@ -1,47 +1,59 @@
-from itertools import combinations
+import json
+from argparse import ArgumentParser
+from pathlib import Path
 
 import polars as pl
-from full_pun_generation.context import expand_keywords, extract_keywords
-from full_pun_generation.pronunciation import (get_pronunciation,
-                                               phoneme_to_grapheme)
-from full_pun_generation.wordnet import (get_ambiguous_words,
-                                         get_valid_words,
-                                         get_words_synsets,
-                                         get_definitions_similarity)
+from full_pun_generation.pipeline import (Pipeline, T5Generator,
+                                          generation_stage, sign_stages)
+from full_pun_generation.signs import SignsCache
 
+parser = ArgumentParser()
+parser.add_argument("--generate",
+                    help="Also generate jokes with PTT5 in the same pipeline, overlapping "
+                         "generation with the sign discovery of the next headlines",
+                    action="store_true")
+parser.add_argument("--max_signs",
+                    help="Signs of each headline jokes are generated for",
+                    type=int, default=3)
+parser.add_argument("--batch_size",
+                    help="Headlines in each generation batch",
+                    type=int, default=8)
+args = parser.parse_args()
 
-def get_signs(text, n_keywords=5):
-    keywords = extract_keywords(text, n_keywords)
-    expanded_keywords = expand_keywords(keywords)
-    words = {kw for kw, _ in expanded_keywords}
+cache = SignsCache()
 
-    homographic_signs = get_ambiguous_words(words)
-    signs = [[[str(w), str(def1)], [str(w), str(def2)]]
-             for w, _, def1, def2 in homographic_signs if w]
+stages = sign_stages(cache)
+if args.generate:
+    stages.append(generation_stage(T5Generator(), args.batch_size, args.max_signs))
 
-    graphemes = [phoneme_to_grapheme(pron)[1]
-                 for pron in get_pronunciation(words)]
-    graphemes = [get_valid_words(g) for g in graphemes]
-    graphemes = [g for g in graphemes if len(g) > 1]
-    for g in graphemes:
-        for w1, w2 in combinations(g, 2):
-            w1, w2 = str(w1), str(w2)
-            if w1 == w2:
-                continue
-            synsets = get_words_synsets([w1, w2])
-            _, def1, def2 = get_definitions_similarity(synsets[0], synsets[1])
-            if [[w1, def1], [w2, def2]] in signs:
-                continue
-            signs.append([[w1, def1], [w2, def2]])
-    return signs
+df = pl.read_ndjson("data/headlines.jsonl")
+with Pipeline(stages) as pipeline:
+    items = pipeline.map({"headline": headline} for headline in df["headline"])
+    with pl.Config(tbl_cols=-1, tbl_width_chars=250):
+        print(pipeline.report())
 
+if args.generate:
+    jokes = (df.with_columns(pl.Series("jokes", [item["jokes"] for item in items]))
+             .explode("jokes")
+             .drop_nulls("jokes")
+             .unnest("jokes")
+             .with_columns(
+                 pl.struct("pun sign", "alternative sign", "joke")
+                 .map_elements(lambda x: json.dumps({"palavras": [x["pun sign"],
+                                                                  x["alternative sign"]],
+                                                     "trocadilho": x["joke"]},
+                                                    ensure_ascii=False),
+                               return_dtype=pl.String)
+                 .alias("generated"))
+             .drop("joke"))
+    savepath = Path("results/generation/ptt5-v2_pipeline.jsonl")
+    savepath.parent.mkdir(exist_ok=True, parents=True)
+    jokes.write_ndjson(savepath)
+    print(f"Saved {jokes.height} jokes to {savepath}")
 
-df = (pl.read_ndjson("data/headlines.jsonl")
-      .with_columns(
-          pl.col("headline").map_elements(
-              get_signs,
-              return_dtype=pl.List(pl.List(pl.List(pl.String)))
-          ).alias("signs"))
+df = (df.with_columns(
+          pl.Series("signs", [item["signs"] for item in items],
+                    dtype=pl.List(pl.List(pl.List(pl.String)))))
       .explode("signs")
       .with_columns(
           pl.col("signs").list.get(0).list.get(0).alias("pun sign"),
@@ -51,3 +63,4 @@ df = (pl.read_ndjson("data/headlines.jsonl")
       .drop("signs")
       )
 df.write_ndjson("data/processed_headlines.jsonl")
+print(json.dumps(cache.stats(), indent=4))
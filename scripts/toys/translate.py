@@ -12,7 +12,7 @@ def translate(text):
 
     new_sentence = []
     for i, word in enumerate(phonetic_words):
-        all_writings, _ = pron.phoneme_to_grapheme(word)
+        all_writings, _ = pron.phoneme_to_grapheme(word, top_k=20)
         weights = [editdistance.eval(grapheme_words[i], w) for w in all_writings]
         weights = [1 / (w + 1) for w in weights]
 
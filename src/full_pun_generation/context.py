@@ -1,5 +1,7 @@
 import logging
+from functools import lru_cache
 
+import numpy as np
 from keybert import KeyBERT
 from transformers import pipeline
 from gensim.models import KeyedVectors
@@ -8,9 +10,14 @@ kw_model = KeyBERT(model='paraphrase-multilingual-MiniLM-L12-v2')
 pos_model = pipeline('ner', model='Emanuel/porttagger-base')
 embeddings_model = KeyedVectors.load('../Resources/Embeddings/Portuguese/glove_s300.kv')
 
-def pos_tagging(text):
-    logging.info('Performing POS tagging')
-    doc = pos_model(text)
+
+@lru_cache(maxsize=None)
+def normed_vectors():
+    """Unit-length GloVe vectors, computed once (gensim copies them on every call)."""
+    return embeddings_model.get_normed_vectors()
+
+
+def merge_subword_tags(doc):
     pos_tags = [(str(ent['word']), str(ent['entity'])) for ent in doc]
 
     # Deal with subword tokens that start with '##'
@@ -28,13 +35,17 @@ def pos_tagging(text):
         i += 1
     return merged_tags
 
-def extract_keywords(text, n_keywords=5):
-    logging.info(f'Extracting {n_keywords} keywords')
+def pos_tagging(text):
+    logging.info('Performing POS tagging')
+    doc = pos_model(text)
+    return merge_subword_tags(doc)
 
-    text = text[:512] # Truncate text because of PoS model
-    logging.info(f'Input text: {text}')
+def pos_tagging_batch(texts, batch_size=32):
+    logging.info(f'Performing POS tagging of {len(texts)} texts')
+    docs = pos_model(list(texts), batch_size=batch_size)
+    return [merge_subword_tags(doc) for doc in docs]
 
-    pos_tags = pos_tagging(text)
+def keywords_from_tags(text, pos_tags, n_keywords=5):
     stop_words = {word.lower() for word, tag in pos_tags
                   if tag not in ['NOUN', 'PROPN', 'ADJ', 'VERB', 'ADV']}
 
@@ -42,6 +53,23 @@ def extract_keywords(text, n_keywords=5):
                                          stop_words=list(stop_words))
     return keywords
 
+def extract_keywords(text, n_keywords=5):
+    logging.info(f'Extracting {n_keywords} keywords')
+
+    text = text[:512] # Truncate text because of PoS model
+    logging.info(f'Input text: {text}')
+
+    pos_tags = pos_tagging(text)
+    return keywords_from_tags(text, pos_tags, n_keywords)
+
+def extract_keywords_batch(texts, n_keywords=5, batch_size=32):
+    """Keywords of each text, POS tagging all texts in batches."""
+    logging.info(f'Extracting {n_keywords} keywords from {len(texts)} texts')
+
+    texts = [text[:512] for text in texts] # Truncate text because of PoS model
+    return [keywords_from_tags(text, pos_tags, n_keywords)
+            for text, pos_tags in zip(texts, pos_tagging_batch(texts, batch_size))]
+
 def expand_keywords(keywords):
     expanded_keywords = keywords.copy()
     for keyword, _ in keywords:
@@ -51,3 +79,25 @@ def expand_keywords(keywords):
         similar_words = embeddings_model.most_similar(keyword, topn=5)
         expanded_keywords += similar_words
     return expanded_keywords
+
+def similar_words(keywords, topn=5, chunk_size=16):
+    """
+    The `topn` most similar words (as in `most_similar`) of each keyword,
+    scoring keywords in chunks with one matrix product instead of one
+    pass over the vocabulary per keyword.
+    """
+    keywords = [kw for kw in dict.fromkeys(keywords) if kw in embeddings_model]
+    vectors = normed_vectors() if keywords else None
+    topn = min(topn, len(vectors) - 1) if keywords else topn
+    similar = dict()
+    for i in range(0, len(keywords), chunk_size):
+        chunk = keywords[i:i+chunk_size]
+        indices = [embeddings_model.key_to_index[kw] for kw in chunk]
+        similarities = vectors @ vectors[indices].T
+        similarities[indices, range(len(indices))] = -np.inf
+        top = np.argpartition(-similarities, topn, axis=0)[:topn]
+        for j, kw in enumerate(chunk):
+            best = top[np.argsort(-similarities[top[:, j], j]), j]
+            similar[kw] = [(embeddings_model.index_to_key[k], float(similarities[k, j]))
+                           for k in best]
+    return similar
@@ -0,0 +1,260 @@
+import logging
+from argparse import ArgumentParser
+from array import array
+from collections import defaultdict
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+
+import numpy as np
+from tqdm import tqdm
+
+from full_pun_generation.pronunciation import (encode_pronunciation,
+                                               get_pronunciation, inventory)
+
+lexicon_path = Path("data/cache/lexicon.npz")
+
+
+class Lexicon():
+    """
+    Words and their encoded pronunciations, stored as one uint16 buffer
+    with the offset of each pronunciation.
+    """
+    def __init__(self, words, pronunciations):
+        self.words = list(words)
+        lengths = np.fromiter(map(len, pronunciations), dtype=np.int64,
+                              count=len(pronunciations))
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self.codes = (np.frombuffer(b"".join(p.tobytes() for p in pronunciations),
+                                    dtype=np.uint16)
+                      if pronunciations else np.empty(0, dtype=np.uint16))
+
+    def __len__(self):
+        return len(self.words)
+
+    def pronunciation(self, i):
+        return array("H", self.codes[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+    def save(self, filepath=lexicon_path):
+        filepath = Path(filepath)
+        filepath.parent.mkdir(exist_ok=True, parents=True)
+        # The inventory is saved so ids of phonemes interned on the fly can
+        # be mapped to the ids of the process loading the lexicon
+        np.savez(filepath, words=np.array(self.words, dtype=str),
+                 offsets=self.offsets, codes=self.codes,
+                 phonemes=np.array(inventory.phonemes, dtype=str))
+
+    @classmethod
+    def load(cls, filepath=lexicon_path):
+        with np.load(filepath) as data:
+            codes = data["codes"]
+            if codes.dtype != np.uint16:
+                raise RuntimeError(f"{filepath} was built with an older pronunciation "
+                                   "encoding, build it again")
+            remap = np.arange(inventory.id_mask + 1, dtype=np.uint16)
+            for i, phoneme in enumerate(data["phonemes"]):
+                remap[i] = inventory.intern(phoneme)
+            lexicon = cls.__new__(cls)
+            lexicon.words = data["words"].tolist()
+            lexicon.offsets = data["offsets"]
+            lexicon.codes = remap[codes & inventory.id_mask] | (codes & ~np.uint16(inventory.id_mask))
+        return lexicon
+
+
+def build_lexicon(words, shard_size=1000, njobs=4):
+    """Phonemize `words` in shards, skipping those espeak cannot pronounce."""
+    words = sorted(set(words))
+    lexicon_words, pronunciations = list(), list()
+    for i in tqdm(range(0, len(words), shard_size)):
+        shard = words[i:i+shard_size]
+        for word, pron in zip(shard, get_pronunciation(shard, njobs=njobs)):
+            if pron:
+                lexicon_words.append(word)
+                pronunciations.append(encode_pronunciation(pron))
+    return Lexicon(lexicon_words, pronunciations)
+
+
+@lru_cache(maxsize=None)
+def load_lexicon(filepath=lexicon_path):
+    return Lexicon.load(filepath)
+
+
+def edit_distance(a, b, max_distance=None):
+    """
+    Levenshtein distance between two encoded pronunciations. With
+    `max_distance`, returns max_distance + 1 as soon as it is exceeded.
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        current = [i]
+        for j, cb in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def deletions(key, max_distance):
+    """Every code sequence obtained by deleting up to `max_distance` codes."""
+    variants = {key}
+    for n in range(1, min(max_distance, len(key)) + 1):
+        variants.update(tuple(key[i] for i in range(len(key)) if i not in removed)
+                        for removed in combinations(range(len(key)), n))
+    return variants
+
+
+class NearHomophoneIndex():
+    """
+    Symmetric deletion index (as in SymSpell) over the lexicon
+    pronunciations. Two pronunciations within edit distance k share a
+    variant with at most k codes deleted, so a query only looks up the
+    deletions of its own pronunciation and checks the few candidates
+    found, instead of comparing against the whole lexicon.
+    """
+    def __init__(self, lexicon, max_distance=1):
+        self.lexicon = lexicon
+        self.max_distance = max_distance
+        self.keys = list()
+        self.words = list()
+        key_ids = dict()
+        for i in range(len(lexicon)):
+            key = tuple(lexicon.pronunciation(i))
+            if key not in key_ids:
+                key_ids[key] = len(self.keys)
+                self.keys.append(key)
+                self.words.append(list())
+            self.words[key_ids[key]].append(lexicon.words[i])
+
+        self.index = defaultdict(list)
+        for key_id, key in enumerate(self.keys):
+            for variant in deletions(key, max_distance):
+                self.index[variant].append(key_id)
+
+    def query(self, pronunciation, max_distance=None):
+        """
+        Words pronounced within `max_distance` edits of `pronunciation` (an
+        encoding), as (word, distance) pairs sorted by distance.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        if max_distance > self.max_distance:
+            raise ValueError(f"The index was built for distances up to {self.max_distance}")
+        key = tuple(pronunciation)
+        candidates = {key_id for variant in deletions(key, max_distance)
+                      for key_id in self.index.get(variant, ())}
+        results = list()
+        for key_id in candidates:
+            distance = edit_distance(key, self.keys[key_id], max_distance)
+            if distance <= max_distance:
+                results.extend((word, distance) for word in self.words[key_id])
+        return sorted(results, key=lambda x: (x[1], x[0]))
+
+
+@lru_cache(maxsize=None)
+def get_near_homophone_index(max_distance=1, filepath=lexicon_path):
+    logging.info(f"Building near-homophone index (distance {max_distance})")
+    return NearHomophoneIndex(load_lexicon(filepath), max_distance)
+
+
+class PhonemeTrie():
+    """
+    Trie over the lexicon pronunciations, ignoring stress, used to split a
+    pronunciation into sequences of lexicon words (e.g. "entremeada" into
+    "entre miada").
+    """
+    words_key = -1
+
+    def __init__(self, lexicon):
+        self.root = dict()
+        for i in range(len(lexicon)):
+            node = self.root
+            for code in lexicon.pronunciation(i):
+                node = node.setdefault(code & inventory.id_mask, dict())
+            node.setdefault(self.words_key, list()).append(lexicon.words[i])
+
+    def matches(self, ids):
+        """Words matching at each position, as (end, words) pairs."""
+        edges = [list() for _ in ids]
+        for start in range(len(ids)):
+            node = self.root
+            for end in range(start, len(ids)):
+                node = node.get(ids[end])
+                if node is None:
+                    break
+                if self.words_key in node:
+                    edges[start].append((end + 1, node[self.words_key]))
+        return edges
+
+    def segmentations(self, pronunciation, min_words=2, max_words=3, limit=100):
+        """
+        Sequences of `min_words` to `max_words` lexicon words pronounced as
+        `pronunciation` (an encoding), at most `limit` of them, fewest
+        words first. The fewest words needed to reach the end from each
+        position is computed first, so only segmentations that can be
+        completed are walked.
+        """
+        ids = [c & inventory.id_mask for c in pronunciation if c != inventory.separator]
+        n = len(ids)
+        edges = self.matches(ids)
+        fewest = [0] * (n + 1)
+        for start in reversed(range(n)):
+            fewest[start] = min((1 + fewest[end] for end, _ in edges[start]),
+                                default=n + 1)
+
+        results = list()
+        for n_words in range(max(min_words, fewest[0]), max_words + 1):
+            stack = [(0, ())]
+            while stack and len(results) < limit:
+                start, path = stack.pop()
+                if start == n:
+                    if len(path) == n_words:
+                        results.append(path)
+                    continue
+                for end, words in reversed(edges[start]):
+                    if len(path) + 1 + fewest[end] > n_words:
+                        continue
+                    stack.extend((end, path + (word,)) for word in reversed(words))
+        return results[:limit]
+
+
+@lru_cache(maxsize=None)
+def get_phoneme_trie(filepath=lexicon_path):
+    return PhonemeTrie(load_lexicon(filepath))
+
+
+def segment_pronunciation(pronunciation, min_words=2, max_words=3, limit=100):
+    """
+    Multi-word writings of a pronunciation (an espeak string or its
+    encoding), as a candidate generator alongside `phoneme_to_grapheme`.
+    """
+    codes = (encode_pronunciation(pronunciation) if isinstance(pronunciation, str)
+             else pronunciation)
+    return [" ".join(words) for words in
+            get_phoneme_trie().segmentations(codes, min_words, max_words, limit)]
+
+
+def parse_args():
+    parser = ArgumentParser(description="Phonemize the Portuguese WordNet lexicon")
+    parser.add_argument("-o", "--output", type=Path, default=lexicon_path)
+    parser.add_argument("--shard_size", type=int, default=1000)
+    parser.add_argument("--njobs", type=int, default=4)
+    return parser.parse_args()
+
+
+def main():
+    from full_pun_generation.wordnet import lemma_names
+
+    args = parse_args()
+    words = [w for w in lemma_names() if w.isalpha()]
+    lexicon = build_lexicon(words, args.shard_size, args.njobs)
+    lexicon.save(args.output)
+    print(f"Saved {len(lexicon)} pronunciations to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
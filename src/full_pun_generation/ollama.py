@@ -0,0 +1,297 @@
+import json
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import polars as pl
+
+joke_keys = ("palavras", "trocadilho")
+# Upper edges (in seconds) of the latency histogram bins
+latency_bins = (1, 2, 5, 10, 20, 50, 100, float("inf"))
+
+
+class JsonObjectScanner():
+    """
+    Incrementally scans streamed model output for the first complete JSON
+    object with the joke keys. Text inside a <think> block (the reasoning
+    of models such as deepseek-r1) is counted as reasoning and not
+    scanned, as it may contain braces.
+    """
+    def __init__(self, keys=joke_keys):
+        self.keys = keys
+        self.text = ""
+        self.result = None
+        self.tokens = 0
+        self.reasoning_tokens = 0
+        # Position from which to scan, None while the reasoning is not over
+        self._pos = None
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """Add a streamed chunk (one token); returns the object once it is complete."""
+        self.text += chunk
+        self.tokens += 1
+        if self._pos is None:
+            start = self.text.lstrip()
+            if start.startswith("<think>"):
+                self.reasoning_tokens += 1
+                end = self.text.find("</think>")
+                if end < 0:
+                    return None
+                self._pos = end + len("</think>")
+            elif "<think>".startswith(start):
+                # Could still be the start of the reasoning
+                return None
+            else:
+                self._pos = 0
+
+        for i in range(self._pos, len(self.text)):
+            char = self.text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == "\"":
+                    self._in_string = False
+            elif char == "\"" and self._depth > 0:
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._complete(self.text[self._start:i + 1]):
+                    self._pos = i + 1
+                    return self.result
+        self._pos = len(self.text)
+        return None
+
+    def _complete(self, candidate):
+        try:
+            obj = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        if isinstance(obj, dict) and all(key in obj for key in self.keys):
+            self.result = obj
+            return True
+        return False
+
+
+def stream_generate(chain, prompt_data, reasoning_budget=None, max_tokens=None):
+    """
+    Stream a generation and cancel it as soon as the joke JSON object is
+    complete, or when the reasoning exceeds `reasoning_budget` tokens.
+    Returns the text generated until then and the scanner statistics.
+    With `max_tokens`, the generation limit of the model (num_predict),
+    a cancelled generation saved at most the tokens it had left.
+    """
+    scanner = JsonObjectScanner()
+    stop_reason = "end"
+    stream = chain.stream(prompt_data)
+    try:
+        for chunk in stream:
+            if scanner.feed(chunk) is not None:
+                stop_reason = "json"
+                break
+            if reasoning_budget is not None and scanner.reasoning_tokens > reasoning_budget:
+                stop_reason = "reasoning budget"
+                break
+    finally:
+        # Closing the stream closes the HTTP response, so Ollama stops generating
+        stream.close()
+    tokens_saved = 0
+    if stop_reason != "end":
+        tokens_saved = None if max_tokens is None else max(0, max_tokens - scanner.tokens)
+    return {"generated": scanner.text,
+            "tokens": scanner.tokens,
+            "reasoning tokens": scanner.reasoning_tokens,
+            "stop reason": stop_reason,
+            "tokens saved": tokens_saved}
+
+
+def endpoint_errors():
+    """
+    Exceptions raised when an endpoint cannot answer: connection errors and
+    timeouts (OSError, httpx errors) and error statuses (ollama.ResponseError).
+    """
+    from httpx import HTTPError
+    from ollama import ResponseError
+
+    return (OSError, HTTPError, ResponseError)
+
+
+class Endpoint():
+    """An Ollama server, with its load and the statistics of its requests."""
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.completed = 0
+        self.failures = 0
+        self.latencies = list()
+
+    def check_health(self, timeout=5.0):
+        try:
+            with urllib.request.urlopen(f"{self.url}/api/tags", timeout=timeout) as response:
+                self.healthy = response.status == 200
+        except OSError:
+            self.healthy = False
+        return self.healthy
+
+
+class Dispatcher():
+    """
+    Dispatches requests over several Ollama endpoints, each one to the
+    healthy endpoint with the fewest outstanding requests. A request that
+    fails with one of the `errors` of the endpoint (see `endpoint_errors`)
+    is retried on another endpoint and its endpoint is marked as unhealthy
+    until a health check (GET /api/tags, every `health_interval` seconds)
+    succeeds again. Other exceptions are raised at once. `make_chain`
+    builds the chain for an endpoint URL, and up to `max_outstanding`
+    requests are sent to each endpoint at once.
+    """
+    def __init__(self, urls, make_chain, max_outstanding=2, max_attempts=3,
+                 health_interval=30.0, health_timeout=5.0, errors=None):
+        self.endpoints = [Endpoint(url) for url in dict.fromkeys(urls)]
+        self.chains = {endpoint.url: make_chain(endpoint.url) for endpoint in self.endpoints}
+        self.max_outstanding = max_outstanding
+        self.max_attempts = max_attempts
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.errors = errors if errors is not None else endpoint_errors()
+        self._condition = threading.Condition()
+        # Health checks started and completed
+        self._checks_started = 0
+        self._checks_completed = 0
+        self._executor = ThreadPoolExecutor(max_outstanding * len(self.endpoints))
+        self._closed = threading.Event()
+        self._start = time.perf_counter()
+
+        self.check_health()
+        self._health_thread = threading.Thread(target=self._health_loop, daemon=True)
+        self._health_thread.start()
+
+    def check_health(self):
+        with self._condition:
+            self._checks_started += 1
+            check = self._checks_started
+        for endpoint in self.endpoints:
+            endpoint.check_health(self.health_timeout)
+        with self._condition:
+            self._checks_completed = max(self._checks_completed, check)
+            self._condition.notify_all()
+
+    def _health_loop(self):
+        while not self._closed.wait(self.health_interval):
+            self.check_health()
+
+    def _acquire(self, excluded):
+        """Least loaded healthy endpoint, preferring those not in `excluded`."""
+        with self._condition:
+            next_check = None
+            while True:
+                if self._closed.is_set():
+                    raise RuntimeError("Dispatcher is closed")
+                healthy = [e for e in self.endpoints if e.healthy]
+                if not healthy:
+                    # Wait for a whole health check started after all
+                    # endpoints were down to bring one back
+                    if next_check is None:
+                        next_check = self._checks_started + 1
+                    elif self._checks_completed >= next_check:
+                        raise RuntimeError("No healthy Ollama endpoint")
+                    self._condition.wait()
+                    continue
+                available = [e for e in healthy if e.outstanding < self.max_outstanding]
+                candidates = [e for e in available if e not in excluded] or available
+                if candidates:
+                    endpoint = min(candidates, key=lambda e: e.outstanding)
+                    endpoint.outstanding += 1
+                    return endpoint
+                self._condition.wait()
+
+    def _run(self, fn, args):
+        excluded = set()
+        for attempt in range(self.max_attempts):
+            endpoint = self._acquire(excluded)
+            start = time.perf_counter()
+            try:
+                result = fn(self.chains[endpoint.url], *args)
+            except self.errors:
+                with self._condition:
+                    endpoint.outstanding -= 1
+                    endpoint.failures += 1
+                    endpoint.healthy = False
+                    self._condition.notify_all()
+                excluded.add(endpoint)
+                if attempt + 1 == self.max_attempts:
+                    raise
+                continue
+            except Exception:
+                with self._condition:
+                    endpoint.outstanding -= 1
+                    self._condition.notify_all()
+                raise
+            with self._condition:
+                endpoint.outstanding -= 1
+                endpoint.completed += 1
+                endpoint.latencies.append(time.perf_counter() - start)
+                self._condition.notify_all()
+            return result
+
+    def submit(self, fn, *args):
+        """Run `fn(chain, *args)` on an endpoint; returns a future."""
+        return self._executor.submit(self._run, fn, args)
+
+    def map(self, fn, items):
+        """Results of `fn(chain, item)` for each item, in order."""
+        return [future.result() for future in [self.submit(fn, item) for item in items]]
+
+    def report(self):
+        """Throughput, latency percentiles and latency histogram of each endpoint."""
+        elapsed = time.perf_counter() - self._start
+        rows = list()
+        for endpoint in self.endpoints:
+            latencies = np.array(endpoint.latencies)
+            counts, _ = np.histogram(latencies, bins=(0, *latency_bins))
+            p50, p95 = (np.percentile(latencies, [50, 95]) if len(latencies)
+                        else (None, None))
+            row = {"endpoint": endpoint.url,
+                   "healthy": endpoint.healthy,
+                   "completed": endpoint.completed,
+                   "failures": endpoint.failures,
+                   "requests/s": endpoint.completed / elapsed,
+                   "p50 (s)": p50,
+                   "p95 (s)": p95}
+            lower = 0
+            for upper, count in zip(latency_bins, counts):
+                row[f"{lower}-{upper}s" if upper != float("inf") else f">{lower}s"] = int(count)
+                lower = upper
+            rows.append(row)
+        return pl.DataFrame(rows)
+
+    def close(self, cancel=False):
+        """
+        Wait for the submitted requests, or cancel those not started yet
+        (and fail those waiting for a healthy endpoint).
+        """
+        if not cancel:
+            self._executor.shutdown()
+        self._closed.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        # Leaving on an exception does not wait for the remaining requests
+        self.close(cancel=exc_type is not None)
@@ -0,0 +1,273 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+from functools import partial
+
+import polars as pl
+
+from full_pun_generation.signs import (assemble_signs, find_homographs,
+                                       find_homophones, find_keywords,
+                                       find_pronunciations, find_words)
+
+t5_model_name = "Superar/ptt5-v2-pun-generation"
+
+
+class Stage():
+    """
+    A pipeline step run on micro-batches: `fn` takes a list of up to
+    `batch_size` items and returns the list of their results. A batch is
+    processed once full or `max_wait` seconds after its first item
+    arrived, by one of the `workers` threads of the stage.
+    """
+    def __init__(self, name, fn, batch_size=1, max_wait=0.05, workers=1):
+        self.name = name
+        self.fn = fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.workers = workers
+        self.items = 0
+        self.batches = 0
+        self.failures = 0
+        self.retries = 0
+        self.busy = 0.0
+        self.blocked = 0.0
+
+
+class PipelineFuture(Future):
+    """Future of an item, with the stage it is in and since when."""
+    def __init__(self):
+        super().__init__()
+        self.progress = (0, time.perf_counter())
+
+
+def _resolve(future, result=None, exception=None):
+    # The future may have been cancelled by its caller in the meantime
+    try:
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class Pipeline():
+    """
+    Runs stages concurrently, each in its own threads, connected by queues
+    of at most `queue_size` items. A stage waiting on a full queue stops
+    taking items, so a slow stage throttles the ones before it down to
+    `submit` (backpressure). Model inference and espeak release the GIL,
+    so the model-bound stages overlap with the CPU-bound ones. An item
+    whose future was cancelled is dropped at the next stage, and a batch
+    that raises (or whose results do not match its items) is retried one
+    item at a time, so that only the futures of the items that fail on
+    their own get the exception.
+    """
+    _done = object()
+
+    def __init__(self, stages, queue_size=256):
+        self.stages = stages
+        self.queues = [queue.Queue(queue_size) for _ in stages]
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self._threads = [[threading.Thread(target=self._work, args=(i,), daemon=True)
+                          for _ in range(stage.workers)]
+                         for i, stage in enumerate(stages)]
+        for threads in self._threads:
+            for thread in threads:
+                thread.start()
+
+    def _collect(self, i):
+        """Next micro-batch of stage `i`, and whether the stage is closing."""
+        first = self.queues[i].get()
+        if first is self._done:
+            return [], True
+        batch = [first]
+        deadline = time.perf_counter() + self.stages[i].max_wait
+        while len(batch) < self.stages[i].batch_size:
+            try:
+                entry = self.queues[i].get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if entry is self._done:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    @staticmethod
+    def _call(stage, items):
+        """Results of the stage on `items`, raising if there is not one per item."""
+        results = list(stage.fn(items))
+        if len(results) != len(items):
+            raise RuntimeError(f"Stage {stage.name} returned {len(results)} results "
+                               f"for {len(items)} items")
+        return results
+
+    def _apply(self, stage, items):
+        """
+        Results of the stage on a batch of items, and the exceptions of the
+        items that failed (by position). If the batch raises, or does not
+        return one result per item, its items are retried one at a time, so
+        an item that fails does not fail the others.
+        """
+        try:
+            return self._call(stage, items), dict()
+        except Exception as e:
+            if len(items) == 1:
+                return [None], {0: e}
+        with self._lock:
+            stage.retries += 1
+        results, errors = list(), dict()
+        for j, item in enumerate(items):
+            try:
+                results.extend(self._call(stage, [item]))
+            except Exception as e:
+                results.append(None)
+                errors[j] = e
+        return results, errors
+
+    def _work(self, i):
+        stage = self.stages[i]
+        last = i + 1 == len(self.stages)
+        closing = False
+        while not closing:
+            batch, closing = self._collect(i)
+            batch = [(future, item) for future, item in batch if not future.cancelled()]
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            results, errors = self._apply(stage, [item for _, item in batch])
+            busy = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for j, ((future, _), result) in enumerate(zip(batch, results)):
+                if j in errors:
+                    _resolve(future, exception=errors[j])
+                elif last:
+                    _resolve(future, result)
+                else:
+                    future.progress = (i + 1, time.perf_counter())
+                    self.queues[i + 1].put((future, result))
+            with self._lock:
+                stage.items += len(batch) - len(errors)
+                stage.batches += 1
+                stage.failures += len(errors)
+                stage.busy += busy
+                stage.blocked += 0.0 if last else time.perf_counter() - start
+
+    def submit(self, item, block=True):
+        """
+        Future of the result of `item`. Blocks while the first queue is
+        full, or raises queue.Full if not `block`.
+        """
+        future = PipelineFuture()
+        self.queues[0].put((future, item), block=block)
+        return future
+
+    def map(self, items):
+        """Results of the items, in order."""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def report(self):
+        """Items, batches and utilization of each stage."""
+        elapsed = time.perf_counter() - self._start
+        with self._lock:
+            return pl.DataFrame([{"stage": stage.name,
+                                  "workers": stage.workers,
+                                  "batch size": stage.batch_size,
+                                  "items": stage.items,
+                                  "batches": stage.batches,
+                                  "mean batch": stage.items / stage.batches if stage.batches else 0.0,
+                                  "failures": stage.failures,
+                                  "retried batches": stage.retries,
+                                  "busy (s)": stage.busy,
+                                  "utilization": stage.busy / (elapsed * stage.workers),
+                                  "blocked (s)": stage.blocked,
+                                  "queued": queue_.qsize()}
+                                 for stage, queue_ in zip(self.stages, self.queues)])
+
+    def close(self):
+        """Process the items already submitted and stop the stages in order."""
+        for queue_, threads in zip(self.queues, self._threads):
+            for _ in threads:
+                queue_.put(self._done)
+            for thread in threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def sign_stages(cache=None, n_keywords=5, batch_sizes=None, max_wait=0.05):
+    """
+    Stages from a headline (a dict with its "headline") to its signs:
+    keywords (POS tagging and KeyBERT), their GloVe expansion and cache
+    lookup, ambiguity (WordNet and STS), pronunciation (espeak),
+    homophone search (CPU-bound) and the combined signs. Words already
+    cached, or shared by the headlines of a batch, are processed once.
+    """
+    batch_sizes = {"keywords": 16, "expansion": 64, "homographs": 32,
+                   "pronunciation": 64, "homophones": 8, "signs": 64,
+                   **(batch_sizes or dict())}
+    steps = {"keywords": partial(find_keywords, n_keywords=n_keywords),
+             "expansion": partial(find_words, cache=cache),
+             "homographs": find_homographs,
+             "pronunciation": find_pronunciations,
+             "homophones": find_homophones,
+             "signs": partial(assemble_signs, cache=cache)}
+    return [Stage(name, fn, batch_sizes[name], max_wait) for name, fn in steps.items()]
+
+
+def sign_prompt(sign):
+    """A sign as the columns of the processed headlines read by the generators."""
+    (pun_sign, pun_definition), (alt_sign, alt_definition) = sign
+    return {"pun sign": pun_sign, "alternative sign": alt_sign,
+            "pun definition": pun_definition, "alternative definition": alt_definition}
+
+
+class T5Generator():
+    """The fine-tuned PTT5 (words prompt), generating a batch of jokes per call."""
+    def __init__(self, max_new_tokens=64):
+        import torch
+        from transformers import AutoTokenizer, T5ForConditionalGeneration
+
+        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained("unicamp-dl/ptt5-v2-base", legacy=True)
+        self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = T5ForConditionalGeneration.from_pretrained(t5_model_name,
+                                                                subfolder="ptt5-v2-words",
+                                                                device_map=self.device)
+        self.max_new_tokens = max_new_tokens
+
+    def __call__(self, prompts):
+        texts = [f"Gerar trocadilho: {prompt['pun sign']} / {prompt['alternative sign']}"
+                 for prompt in prompts]
+        inputs = self.tokenizer(texts, truncation=True, padding=True, max_length=512,
+                                return_tensors="pt").to(self.device)
+        output = self.model.generate(**inputs, max_new_tokens=self.max_new_tokens)
+        return self.tokenizer.batch_decode(output, skip_special_tokens=True)
+
+
+def generation_stage(generate, batch_size=8, max_signs=3, workers=1):
+    """
+    Stage generating jokes for the first `max_signs` signs of each
+    headline. `generate` takes a list of signs (see `sign_prompt`) and
+    returns their jokes, e.g. a `T5Generator`.
+    """
+    def generate_jokes(items):
+        prompts = [(item, sign_prompt(sign)) for item in items
+                   for sign in item["signs"][:max_signs]]
+        jokes = generate([prompt for _, prompt in prompts]) if prompts else list()
+        for item in items:
+            item["jokes"] = list()
+        for (item, prompt), joke in zip(prompts, jokes):
+            item["jokes"].append({**prompt, "joke": joke})
+        return items
+
+    return Stage("generation", generate_jokes, batch_size, workers=workers)
@@ -1,12 +1,20 @@
+import json
 import logging
+import math
+import os
+import threading
+from argparse import ArgumentParser
+from array import array
+from collections import Counter, defaultdict
+from functools import lru_cache
+from multiprocessing import Pool
 from pathlib import Path
-import re
-from itertools import product
 
+import numpy as np
 from nltk.corpus import wordnet as wn
 from phonemizer import phonemize
 from phonemizer.separator import Separator
-from tqdm import trange
+from tqdm import tqdm
 
 # Phoneme to grapheme mapping for Portuguese
 p2g = {'a': {'a', 'á', 'à', 'ha', 'há'}, 'ã': {'ã', 'am', 'an', 'hã', 'ham', 'han'},
@@ -38,171 +46,472 @@ phonetic_consonants = set(list(p2g.keys())[35:])
 
 graphic_vowels = {'a', 'á', 'à', 'ã', 'â', 'e', 'é', 'ê', 'i', 'í', 'y', 'o',
                   'ó', 'ô', 'õ', 'u', 'ú', 'ú'}
+accent_vowels = frozenset({'á', 'â', 'é', 'ê', 'í', 'ó', 'ô', 'ú'})
+stressed_graphemes = frozenset({'á', 'é', 'í', 'ó', 'ú', 'â', 'ê', 'ô',
+                                'êu', 'éi', 'ói', 'hú', 'áu', 'ál', 'hí',
+                                'ím', 'ín', 'éu', 'él', 'hé', 'hél'})
 
-def generate_all_possibilities(graphemes, preffix=''):
-    if len(graphemes) == 0:
-        return [preffix]
 
-    # Orthographic rules
+@lru_cache(maxsize=None)
+def allowed_graphemes(graphemes, has_accent, last_char):
+    """
+    Orthographic rules, which only depend on whether the prefix already
+    has an accented vowel and on its last character.
+    """
     # Only one accented vowel per word
-    accent_vowels = {'á', 'â', 'é', 'ê', 'í', 'ó', 'ô', 'ú'}
-    if re.search(rf'[{"".join(accent_vowels)}]', preffix):
-        graphemes[0] = graphemes[0] - accent_vowels
+    if has_accent:
+        graphemes = tuple(g for g in graphemes if g not in accent_vowels)
     # No 'h' after 'h'
-    if preffix.endswith('h'):
-        start_with_h = {graph for graph in graphemes[0] if graph.startswith('h')}
-        graphemes[0] = graphemes[0] - start_with_h
-    # No repeating consonants
-    if preffix and preffix[-1] not in graphic_vowels and preffix[-1] == graphemes[0]:
-        start_with_last = {graph for graph in graphemes[0] if graph.startswith(preffix[-1])}
-        graphemes[0] = graphemes[0] - start_with_last
+    if last_char == 'h':
+        graphemes = tuple(g for g in graphemes if not g.startswith('h'))
     # No 'ql' for 'qu'
-    if preffix.endswith('q'):
-        start_with_l = {graph for graph in graphemes[0] if graph.startswith('l')}
-        graphemes[0] = graphemes[0] - start_with_l
+    if last_char == 'q':
+        graphemes = tuple(g for g in graphemes if not g.startswith('l'))
+    # Note: a "no repeating consonants" rule used to compare the last
+    # character with the whole grapheme set, so it never applied. It is
+    # left out to keep the generated writings unchanged.
+    return tuple((g, has_accent or any(c in accent_vowels for c in g),
+                  g[-1] if g else last_char) for g in graphemes)
 
-    new_preffixes = [''.join(p) for p in product([preffix], graphemes[0])]
-    possibilities = list()
-    for p in new_preffixes:
-        possibilities += generate_all_possibilities(graphemes[1:], preffix=p)
-    return possibilities
 
-def phoneme_to_grapheme(pronunciation):
-    logging.info(f'Generating graphemes for: {pronunciation}')
-    phonemes = pronunciation.replace('ˌ', '')
-    phonemes = phonemes.replace(' ', '|')
-    phonemes = phonemes.replace('k|s', 'ks')
-    phonemes = phonemes.replace('l|j', 'ʎ')
-    phonemes = phonemes.replace('t|ʃ', 'tʃ')
-    phonemes = phonemes.split('|')
+def generate_all_possibilities(graphemes, preffix=''):
+    has_accent = any(c in accent_vowels for c in preffix)
+    possibilities = [(preffix, has_accent, preffix[-1] if preffix else '')]
+    for options in graphemes:
+        if not isinstance(options, tuple):
+            options = tuple(sorted(options))
+        possibilities = [(p + g, accent, last)
+                         for p, has_accent, last_char in possibilities
+                         for g, accent, last in allowed_graphemes(options, has_accent,
+                                                                  last_char)]
+    return [p for p, _, _ in possibilities]
+
+
+class PhonemeInventory():
+    """
+    Interns phonemes as integers. A pronunciation is stored as an
+    array('H') with one code per espeak phoneme: the phoneme id in the low
+    14 bits, and the primary and secondary stress flags in the two high
+    bits. Words are separated by the reserved `separator` code, so two
+    pronunciations have the same encoding only if espeak wrote them the
+    same. Phonemes are interned in the order they are first seen, after
+    the ones the inventory starts with, so ids of those are the same in
+    every process.
+    """
+    stress_flag = 0x8000
+    secondary_flag = 0x4000
+    id_mask = 0x3FFF
+    separator = id_mask
+    stress_marks = {stress_flag: 'ˈ', secondary_flag: 'ˌ'}
+
+    def __init__(self, phonemes=()):
+        self.phonemes = list()
+        self.ids = dict()
+        # Pipeline stages encode pronunciations from several threads
+        self._lock = threading.Lock()
+        for phoneme in phonemes:
+            self.intern(phoneme)
+
+    def intern(self, phoneme):
+        i = self.ids.get(phoneme)
+        if i is not None:
+            return i
+        with self._lock:
+            if phoneme not in self.ids:
+                if len(self.phonemes) == self.separator:
+                    raise RuntimeError(f'Phoneme inventory is full, cannot encode {phoneme}')
+                self.phonemes.append(phoneme)
+                self.ids[phoneme] = len(self.phonemes) - 1
+            return self.ids[phoneme]
+
+    def phoneme(self, i):
+        return self.phonemes[i]
+
+    def encode(self, pronunciation):
+        codes = array('H')
+        for word in pronunciation.split():
+            if codes:
+                codes.append(self.separator)
+            for token in word.split('|'):
+                if not token:
+                    continue
+                flags = 0
+                for flag, mark in self.stress_marks.items():
+                    if mark in token:
+                        flags |= flag
+                        token = token.replace(mark, '')
+                codes.append(self.intern(token) | flags)
+        return codes
+
+    def decode(self, codes):
+        """
+        Phonemes and stress marks ('ˈ', 'ˌ' or '') of an encoding, with ' '
+        for the word separators.
+        """
+        phonemes, stress = list(), list()
+        for c in codes:
+            if c == self.separator:
+                phonemes.append(' ')
+                stress.append('')
+            else:
+                phonemes.append(self.phoneme(c & self.id_mask))
+                stress.append(''.join(mark for flag, mark in self.stress_marks.items()
+                                      if c & flag))
+        return phonemes, stress
+
+
+inventory = PhonemeInventory(p2g)
+
+
+def encode_pronunciation(pronunciation):
+    """Encode an espeak pronunciation with the shared phoneme inventory."""
+    return inventory.encode(pronunciation)
 
-    stress = [True if 'ˈ' in p else False for p in phonemes]
-    phonemes = [p.replace('ˈ', '') for p in phonemes]
-    graphemes = [p2g[p] if p in p2g else {'-'} for p in phonemes]
+
+def decode_pronunciation(codes):
+    """Phonemes and their stress marks of an encoded pronunciation."""
+    return inventory.decode(codes)
+
+
+def as_numpy(codes):
+    """Zero-copy uint16 view of an encoded pronunciation."""
+    return np.frombuffer(codes, dtype=np.uint16)
+
+
+# Pairs of espeak phonemes spelled as one
+merged_phonemes = {('k', 's'): 'ks', ('l', 'j'): 'ʎ', ('t', 'ʃ'): 'tʃ'}
+
+
+def grapheme_phonemes(codes):
+    """
+    Phoneme ids and primary stress of an encoding as the spelling rules
+    see them: words run together, secondary stress is ignored and the
+    pairs in `merged_phonemes` are one phoneme (unless the second one is
+    stressed).
+    """
+    ids, stress = list(), list()
+    for c in codes:
+        if c == inventory.separator:
+            continue
+        i, stressed = c & inventory.id_mask, bool(c & inventory.stress_flag)
+        if ids and not stressed:
+            merged = merged_phonemes.get((inventory.phoneme(ids[-1]), inventory.phoneme(i)))
+            if merged is not None:
+                ids[-1] = inventory.intern(merged)
+                continue
+        ids.append(i)
+        stress.append(stressed)
+    return ids, stress
+
+
+@lru_cache(maxsize=None)
+def context_graphemes(prev, phoneme, next_, position, unstressed):
+    """
+    Candidate graphemes for a phoneme id in a given context. `prev` and
+    `next_` are None at the word boundaries and `position` is one of
+    'first', 'middle', 'last' or 'only'.
+    """
+    prev, phoneme, next_ = (None if p is None else inventory.phoneme(p)
+                            for p in (prev, phoneme, next_))
+    graphemes = set(p2g[phoneme]) if phoneme in p2g else {'-'}
+    next_graphemes = p2g.get(next_, {'-'})
+    is_first = position in {'first', 'only'}
+    is_last = position in {'last', 'only'}
 
     # Mapping rules
-    for i in range(len(graphemes)):
-        start_with_h = {graph for graph in graphemes[i] if graph.startswith('h')}
-
-        if i == 0:
-            if phonemes[i] in {'h', 'x'}:
-                graphemes[i] = graphemes[i] - {'rr'}
-            if phonemes[i] == 's':
-                graphemes[i] = graphemes[i] - {'ss', 'sç', 'ç', 'x', 'xc'}
-            if phonemes[i] == 'k':
-                graphemes[i] = graphemes[i] - {'ck'}
-            if phonemes[i] == 'w' or phonemes[i] == 'ʊ':
-                graphemes[i] = graphemes[i] - {'l'}
-            if phonemes[i] == 'l':
-                graphemes[i] = graphemes[i] - {'lh'}
-        if i > 0:
-            if phonemes[i] == 'ŋ' and phonemes[i-1] not in {'i', 'ɐ̃'}:
-                graphemes[i] = graphemes[i] - {''}
-            if start_with_h:
-                graphemes[i] = graphemes[i] - start_with_h
-        if i > 0 and i < len(graphemes)-1:
-            if phonemes[i] in {'h', 'x'} and phonemes[i-1] in phonetic_vowels and phonemes[i+1] in phonetic_vowels:
-                graphemes[i] = graphemes[i] - {'r'}
-        if i < len(graphemes)-1:
-            if phonemes[i] == 'tʃ' and phonemes[i+1] in phonetic_aou_vowels:
-                graphemes[i] = graphemes[i] - {'t'}
-            if phonemes[i] == 'dʒ' and phonemes[i+1] in phonetic_aou_vowels:
-                graphemes[i] = graphemes[i] - {'d'}
-            if phonemes[i] == 'ʒ' and phonemes[i+1] in phonetic_aou_vowels:
-                graphemes[i] = graphemes[i] - {'g'}
-            if phonemes[i] == 'ɡ' and phonemes[i+1] in phonetic_consonants:
-                graphemes[i] = graphemes[i] - {'gu'}
-            if phonemes[i] == 'k' and phonemes[i+1] in phonetic_aou_vowels:
-                graphemes[i] = graphemes[i] - {'qu'}
-            if phonemes[i] == 'k' and phonemes[i+1] in phonetic_ei_vowels:
-                graphemes[i] = graphemes[i] - {'c'}
-            if phonemes[i] == 'k' and phonemes[i+1] not in ['w']:
-                graphemes[i] = graphemes[i] - {'q'}
-            if phonemes[i] == 'k' and phonemes[i+1] == 'r':
-                graphemes[i] = graphemes[i] - {'q', 'qu'}
-            if phonemes[i] == 'k' and phonemes[i+1] == 'ɾ':
-                graphemes[i] = graphemes[i] - {'q', 'qu'}
-            if phonemes[i] == 's' and phonemes[i+1] not in phonetic_ei_vowels:
-                graphemes[i] = graphemes[i] - {'sc', 'c', 'xc'}
-            if phonemes[i] == 's' and phonemes[i+1] not in phonetic_aou_vowels:
-                graphemes[i] = graphemes[i] - {'ç', 'sç'}
-            if phonemes[i] == 's' and phonemes[i+1] in phonetic_vowels:
-                graphemes[i] = graphemes[i] - {'z'}
-            if phonemes[i] == 's' and phonemes[i+1] in phonetic_consonants:
-                graphemes[i] = graphemes[i] - {'ss'}
-            if phonemes[i] == 'ŋ' and graphemes[i+1].intersection({'p', 'b'}):
-                graphemes[i] = graphemes[i] - {'n'}
-            if phonemes[i] == 'ŋ' and not graphemes[i+1].intersection({'p', 'b'}):
-                graphemes[i] = graphemes[i] - {'m'}
-            if phonemes[i] == 'eɪ' and not phonemes[i+1] in {'ŋ', 'm', 'n'}:
-                graphemes[i] = {'ei', 'ay', 'a'}
-            if phonemes[i] == 'ks' and phonemes[i+1] not in phonetic_aou_vowels:
-                graphemes[i] = graphemes[i] - {'cç'}
-            if phonemes[i] == 'ks' and phonemes[i+1] not in phonetic_ei_vowels:
-                graphemes[i] = graphemes[i] - {'cc'}
-            if phonemes[i] in {'ã', 'ɐ̃'} and phonemes[i+1] in {'ŋ', 'm', 'n'}:
-                graphemes[i] = graphemes[i] - {'am', 'an'}
-            if phonemes[i] == 'ŋ':
-                graphemes[i] = graphemes[i] - {'ng'}
-            if phonemes[i] == 'ʃ':
-                graphemes[i] = graphemes[i] - {'s', 'z'}
-        if i == len(graphemes)-1:
-            if phonemes[i] == 's':
-                graphemes[i] = graphemes[i] - {'ç', 'sç', 'c', 'sc', 'xc'}
-            if phonemes[i] == 'k':
-                graphemes[i] = graphemes[i] - {'qu', 'q'}
-            if phonemes[i] == 'ks':
-                graphemes[i] = graphemes[i] - {'cç', 'cc'}
-        if 'à' in graphemes[i] and len(phonemes) > 1:
-            graphemes[i] = graphemes[i] - {'à'}
-        if any(stress) and not stress[i]:
-            graphemes[i] = graphemes[i] - {'á', 'é', 'í', 'ó', 'ú', 'â', 'ê', 'ô',
-                                           'êu', 'éi', 'ói', 'hú', 'áu', 'ál', 'hí',
-                                           'ím', 'ín', 'éu', 'él', 'hé', 'hél'}
-    all_writings = generate_all_possibilities(graphemes)
-
-    # Keep only recreations that are pronounced the same
+    start_with_h = {graph for graph in graphemes if graph.startswith('h')}
+
+    if is_first:
+        if phoneme in {'h', 'x'}:
+            graphemes = graphemes - {'rr'}
+        if phoneme == 's':
+            graphemes = graphemes - {'ss', 'sç', 'ç', 'x', 'xc'}
+        if phoneme == 'k':
+            graphemes = graphemes - {'ck'}
+        if phoneme == 'w' or phoneme == 'ʊ':
+            graphemes = graphemes - {'l'}
+        if phoneme == 'l':
+            graphemes = graphemes - {'lh'}
+    if not is_first:
+        if phoneme == 'ŋ' and prev not in {'i', 'ɐ̃'}:
+            graphemes = graphemes - {''}
+        if start_with_h:
+            graphemes = graphemes - start_with_h
+    if not is_first and not is_last:
+        if phoneme in {'h', 'x'} and prev in phonetic_vowels and next_ in phonetic_vowels:
+            graphemes = graphemes - {'r'}
+    if not is_last:
+        if phoneme == 'tʃ' and next_ in phonetic_aou_vowels:
+            graphemes = graphemes - {'t'}
+        if phoneme == 'dʒ' and next_ in phonetic_aou_vowels:
+            graphemes = graphemes - {'d'}
+        if phoneme == 'ʒ' and next_ in phonetic_aou_vowels:
+            graphemes = graphemes - {'g'}
+        if phoneme == 'ɡ' and next_ in phonetic_consonants:
+            graphemes = graphemes - {'gu'}
+        if phoneme == 'k' and next_ in phonetic_aou_vowels:
+            graphemes = graphemes - {'qu'}
+        if phoneme == 'k' and next_ in phonetic_ei_vowels:
+            graphemes = graphemes - {'c'}
+        if phoneme == 'k' and next_ not in ['w']:
+            graphemes = graphemes - {'q'}
+        if phoneme == 'k' and next_ == 'r':
+            graphemes = graphemes - {'q', 'qu'}
+        if phoneme == 'k' and next_ == 'ɾ':
+            graphemes = graphemes - {'q', 'qu'}
+        if phoneme == 's' and next_ not in phonetic_ei_vowels:
+            graphemes = graphemes - {'sc', 'c', 'xc'}
+        if phoneme == 's' and next_ not in phonetic_aou_vowels:
+            graphemes = graphemes - {'ç', 'sç'}
+        if phoneme == 's' and next_ in phonetic_vowels:
+            graphemes = graphemes - {'z'}
+        if phoneme == 's' and next_ in phonetic_consonants:
+            graphemes = graphemes - {'ss'}
+        if phoneme == 'ŋ' and next_graphemes.intersection({'p', 'b'}):
+            graphemes = graphemes - {'n'}
+        if phoneme == 'ŋ' and not next_graphemes.intersection({'p', 'b'}):
+            graphemes = graphemes - {'m'}
+        if phoneme == 'eɪ' and not next_ in {'ŋ', 'm', 'n'}:
+            graphemes = {'ei', 'ay', 'a'}
+        if phoneme == 'ks' and next_ not in phonetic_aou_vowels:
+            graphemes = graphemes - {'cç'}
+        if phoneme == 'ks' and next_ not in phonetic_ei_vowels:
+            graphemes = graphemes - {'cc'}
+        if phoneme in {'ã', 'ɐ̃'} and next_ in {'ŋ', 'm', 'n'}:
+            graphemes = graphemes - {'am', 'an'}
+        if phoneme == 'ŋ':
+            graphemes = graphemes - {'ng'}
+        if phoneme == 'ʃ':
+            graphemes = graphemes - {'s', 'z'}
+    if is_last:
+        if phoneme == 's':
+            graphemes = graphemes - {'ç', 'sç', 'c', 'sc', 'xc'}
+        if phoneme == 'k':
+            graphemes = graphemes - {'qu', 'q'}
+        if phoneme == 'ks':
+            graphemes = graphemes - {'cç', 'cc'}
+    if 'à' in graphemes and position != 'only':
+        graphemes = graphemes - {'à'}
+    if unstressed:
+        graphemes = graphemes - stressed_graphemes
+    return tuple(sorted(graphemes))
+
+
+def get_graphemes(codes):
+    """Look up the candidate graphemes of every phoneme of an encoded pronunciation."""
+    ids, stress = grapheme_phonemes(codes)
+    n = len(ids)
+    any_stress = any(stress)
+    graphemes = list()
+    for i, phoneme in enumerate(ids):
+        if n == 1:
+            position = 'only'
+        elif i == 0:
+            position = 'first'
+        elif i == n - 1:
+            position = 'last'
+        else:
+            position = 'middle'
+        graphemes.append(context_graphemes(ids[i-1] if i > 0 else None,
+                                           phoneme,
+                                           ids[i+1] if i < n - 1 else None,
+                                           position,
+                                           any_stress and not stress[i]))
+    return graphemes
+
+
+class CharNgramModel():
+    """
+    Character n-gram language model with add-k smoothing, used to rank
+    spellings by how plausible they look in Portuguese.
+    """
+    def __init__(self, n=3, k=0.1):
+        self.n = n
+        self.k = k
+        self.counts = defaultdict(Counter)
+        self.totals = dict()
+        self.vocabulary = set()
+
+    def fit(self, words):
+        for word in words:
+            chars = '^' * (self.n - 1) + word + '$'
+            self.vocabulary.update(chars)
+            for i in range(self.n - 1, len(chars)):
+                self.counts[chars[i-self.n+1:i]][chars[i]] += 1
+        self.totals = {context: sum(counts.values())
+                       for context, counts in self.counts.items()}
+        return self
+
+    def log_prob(self, history, char):
+        context = ('^' * (self.n - 1) + history)[-(self.n - 1):]
+        count = self.counts[context][char] if context in self.counts else 0
+        total = self.totals.get(context, 0)
+        return math.log((count + self.k) /
+                        (total + self.k * len(self.vocabulary)))
+
+    def score(self, text, history=''):
+        """Log-probability of appending `text` to `history`."""
+        log_prob = 0.0
+        for char in text:
+            log_prob += self.log_prob(history, char)
+            history += char
+        return log_prob
+
+
+@lru_cache(maxsize=None)
+def get_spelling_model(n=3):
+    from nltk.corpus import floresta
+    logging.info('Training spelling model on Floresta')
+    words = {word.strip().lower() for word in floresta.words()}
+    return CharNgramModel(n).fit(w for w in words if w.isalpha())
+
+
+def ranked_possibilities(graphemes, beam_size=50, max_states=10000, model=None):
+    """
+    Beam search over the grapheme candidates, returning at most
+    `beam_size` writings sorted from most to least plausible. At most
+    `max_states` partial writings are scored, whatever the word length,
+    except that one is always scored per grapheme position (so words
+    longer than `max_states` phonemes still get a writing).
+    """
+    model = model or get_spelling_model()
+    beam = [(0.0, '', False, '')]
+    explored = 0
+    for i, options in enumerate(graphemes):
+        if not isinstance(options, tuple):
+            options = tuple(sorted(options))
+        # Split the remaining budget evenly between the remaining positions,
+        # best partial writings first, always scoring at least one
+        step_budget = max(1, (max_states - explored) // (len(graphemes) - i))
+        expanded = list()
+        for score, prefix, has_accent, last_char in beam:
+            for g, accent, last in allowed_graphemes(options, has_accent, last_char):
+                if len(expanded) >= step_budget:
+                    break
+                expanded.append((score + model.score(g, prefix), prefix + g,
+                                 accent, last))
+            if len(expanded) >= step_budget:
+                break
+        explored += len(expanded)
+        beam = sorted(expanded, key=lambda x: x[0], reverse=True)[:beam_size]
+    ranked = sorted(((score + model.log_prob(prefix, '$'), prefix)
+                     for score, prefix, _, _ in beam), reverse=True)
+    return [prefix for _, prefix in ranked]
+
+
+def phoneme_to_grapheme(pronunciation, top_k=None, beam_size=50, max_states=10000):
+    """
+    Return all writings generated for a pronunciation and those that are
+    pronounced the same. With `top_k`, only the `top_k` most plausible
+    writings are returned, found with a bounded beam search.
+    """
+    logging.info(f'Generating graphemes for: {pronunciation}')
+    codes = encode_pronunciation(pronunciation)
+    graphemes = get_graphemes(codes)
+    if top_k is None:
+        all_writings = generate_all_possibilities(graphemes)
+    else:
+        all_writings = ranked_possibilities(graphemes,
+                                            beam_size=max(beam_size, top_k),
+                                            max_states=max_states)
+
+    # Keep only recreations that are pronounced the same, including the
+    # secondary stress and word separators of the espeak output
     all_prons = get_pronunciation(all_writings)
-    valid_writings = [w for w, w_pron in zip(all_writings, all_prons)
-                      if w_pron == pronunciation]
+    valid_writings = [w for w, pron in zip(all_writings, all_prons)
+                      if encode_pronunciation(pron) == codes]
+    if top_k is not None:
+        return all_writings[:top_k], valid_writings[:top_k]
     return all_writings, valid_writings
 
-def get_pronunciation(words):
+
+def get_pronunciation(words, njobs=4):
     logging.info(f'Getting pronunciation for: {words}')
     phn = phonemize(words, language='pt-br', backend='espeak', strip=True,
                     separator=Separator(phone='|', word=' ', syllable='.'),
-                    with_stress=True, njobs=4)
+                    with_stress=True, njobs=njobs)
     return phn
 
+
+def validate_words(words):
+    """
+    Check whether each word is among the writings generated from its own
+    pronunciation. Words are phonemized in a single batch.
+    """
+    results = list()
+    for word, pronunciation in zip(words, get_pronunciation(words, njobs=1)):
+        if not pronunciation:
+            results.append({'word': word, 'pronunciation': None, 'valid': False})
+            continue
+        codes = encode_pronunciation(pronunciation)
+        all_writings = generate_all_possibilities(get_graphemes(codes))
+        results.append({'word': word, 'pronunciation': pronunciation,
+                         'valid': word.replace('-', '') in set(all_writings)})
+    return results
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--ignore_file',
+                        help='Words whose pronunciation is already covered by the rules.',
+                        type=Path, default=Path('data/ignore_pron_words.txt'))
+    parser.add_argument('--progress_file',
+                        help='Results of processed shards, used to resume a run.',
+                        type=Path, default=Path('data/ignore_pron_words.progress.jsonl'))
+    parser.add_argument('--workers',
+                        help='Number of worker processes.',
+                        type=int, default=os.cpu_count())
+    parser.add_argument('--shard_size',
+                        help='Number of words phonemized and validated per shard.',
+                        type=int, default=500)
+    return parser.parse_args()
+
+
 def main():
     from nltk.corpus import floresta
+    args = parse_args()
     corpus = {word.strip().lower() for word in floresta.words()}
 
-    ignore_filepath = Path('data/ignore_pron_words.txt')
-    ignore_file = ignore_filepath.open('r+')
-    ignore_words = {line.strip() for line in ignore_file if line.strip()
-                    and not line.startswith('#')}
-    corpus = list(corpus - ignore_words)
+    ignore_text = args.ignore_file.read_text()
+    ignore_words = {line.strip() for line in ignore_text.splitlines()
+                    if line.strip() and not line.startswith('#')}
 
-    for i in trange(0, len(corpus), initial=0):
-        word = corpus[i]
-        pronunciation = get_pronunciation([word])[0]
+    # Resume from the shards already processed
+    processed = list()
+    if args.progress_file.exists():
+        with args.progress_file.open() as progress_file:
+            processed = [json.loads(line) for line in progress_file if line.strip()]
+        print(f'Resuming: {len(processed)} words already processed')
+    done = {r['word'] for r in processed}
 
-        if not pronunciation:
-            print(f'No pronunciation found for {word}')
-            continue
-        all_writings, _ = phoneme_to_grapheme(pronunciation)
+    corpus = sorted(corpus - ignore_words - done)
+    shards = [corpus[i:i+args.shard_size]
+              for i in range(0, len(corpus), args.shard_size)]
 
-        if '-' in word:
-            word = word.replace('-', '')
-        if word in all_writings:
-            ignore_file.write(f'{word}\n')
-            continue
+    with args.progress_file.open('a') as progress_file, \
+            Pool(args.workers) as pool:
+        for results in tqdm(pool.imap_unordered(validate_words, shards),
+                            total=len(shards)):
+            for r in results:
+                progress_file.write(json.dumps(r, ensure_ascii=False) + '\n')
+                if r['pronunciation'] is None:
+                    print(f'No pronunciation found for {r["word"]}')
+                elif not r['valid']:
+                    print(f'{r["word"]} -> {r["pronunciation"]}')
+                    print('----------------------------------------')
+            progress_file.flush()
+            processed += results
+
+    # Merge in a deterministic order, regardless of the shard completion order
+    new_words = sorted({r['word'].replace('-', '') for r in processed
+                        if r['valid']} - ignore_words)
+    with args.ignore_file.open('a') as ignore_file:
+        if ignore_text and not ignore_text.endswith('\n'):
+            ignore_file.write('\n')
+        ignore_file.writelines(f'{word}\n' for word in new_words)
+    args.progress_file.unlink()
+    print(f'Added {len(new_words)} words to {args.ignore_file}')
 
-        print(f'{word} -> {pronunciation}')
-        print(all_writings)
-        print('----------------------------------------')
-    ignore_file.close()
 
 if __name__ == '__main__':
     main()
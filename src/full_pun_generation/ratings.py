@@ -0,0 +1,133 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import polars as pl
+
+# Columns of the rating records written by the evaluation interface
+record_schema = {"headline_id": pl.Int64,
+                 "model": pl.String,
+                 "headline": pl.String,
+                 "pun sign": pl.String,
+                 "alternative sign": pl.String,
+                 "generated": pl.String,
+                 "similarity": pl.Float64,
+                 "typicality": pl.Float64,
+                 "score": pl.Float64,
+                 "evaluator": pl.String,
+                 "funniness": pl.String,
+                 "relation": pl.String}
+
+
+class RatingsStore():
+    """
+    Evaluation results shared by every evaluator, in a SQLite database in
+    WAL mode so many sessions can write concurrently while others read.
+    Each rating is stored with its full record, so it can be exported back
+    to the per-evaluator JSONL files.
+    """
+    def __init__(self, filepath, timeout=30):
+        self.filepath = Path(filepath)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.timeout = timeout
+        self._local = threading.local()
+        with self.connection as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ratings (
+                    evaluator TEXT NOT NULL,
+                    headline_id INTEGER NOT NULL,
+                    model TEXT NOT NULL,
+                    generated TEXT NOT NULL,
+                    funniness TEXT,
+                    relation TEXT,
+                    record TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (evaluator, headline_id, model, generated))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS ratings_headline "
+                         "ON ratings (headline_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ratings_model "
+                         "ON ratings (model)")
+
+    @property
+    def connection(self):
+        """One connection per thread, as Streamlit runs sessions in threads."""
+        if not hasattr(self._local, "connection"):
+            conn = sqlite3.connect(self.filepath, timeout=self.timeout)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return self._local.connection
+
+    def upsert(self, rows):
+        """Insert or update ratings given as dicts or a DataFrame."""
+        if isinstance(rows, pl.DataFrame):
+            rows = rows.to_dicts()
+        now = time.time()
+        values = [(row["evaluator"], row["headline_id"], row["model"],
+                   row["generated"], row["funniness"], row["relation"],
+                   json.dumps(row, ensure_ascii=False), now)
+                  for row in rows]
+        with self.connection as conn:
+            conn.executemany("""
+                INSERT INTO ratings VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (evaluator, headline_id, model, generated)
+                DO UPDATE SET funniness = excluded.funniness,
+                              relation = excluded.relation,
+                              record = excluded.record,
+                              updated_at = excluded.updated_at""", values)
+
+    def query(self, evaluator=None, headline_id=None, model=None):
+        """Full records matching the filters, in the order they were first rated."""
+        filters = {"evaluator": evaluator, "headline_id": headline_id,
+                   "model": model}
+        filters = {column: value for column, value in filters.items()
+                   if value is not None}
+        where = " AND ".join(f"{column} = ?" for column in filters)
+        sql = "SELECT record FROM ratings"
+        if where:
+            sql += f" WHERE {where}"
+        sql += " ORDER BY rowid"
+        records = self.connection.execute(sql, list(filters.values())).fetchall()
+        if not records:
+            return pl.DataFrame(schema=record_schema)
+        return pl.DataFrame([json.loads(record) for record, in records])
+
+    def evaluators(self):
+        return [evaluator for evaluator, in self.connection.execute(
+            "SELECT DISTINCT evaluator FROM ratings ORDER BY evaluator")]
+
+    def export_jsonl(self, results_path, evaluator=None):
+        """Write the per-evaluator `<evaluator>.jsonl` files."""
+        evaluators = [evaluator] if evaluator else self.evaluators()
+        for evaluator in evaluators:
+            filepath = Path(results_path) / f"{evaluator}.jsonl"
+            self.query(evaluator=evaluator).write_ndjson(filepath)
+
+    def import_jsonl(self, results_path):
+        """Load existing per-evaluator JSONL files, later rows winning."""
+        for filepath in sorted(Path(results_path).glob("*.jsonl")):
+            self.upsert(read_results_file(filepath))
+
+    def is_empty(self):
+        return self.connection.execute(
+            "SELECT NOT EXISTS (SELECT 1 FROM ratings)").fetchone()[0] == 1
+
+
+def read_results_file(filepath):
+    """
+    Ratings of an evaluator JSONL file. Ratings are appended as they
+    change, so only the latest one of each joke counts.
+    """
+    return (pl.read_ndjson(filepath)
+            .unique(subset=["headline_id", "generated", "model"],
+                    keep="last", maintain_order=True))
+
+
+def load_results(results_path):
+    """Ratings of every evaluator, from the database if it exists, else from the JSONL files."""
+    database_path = Path(results_path) / "results.db"
+    if database_path.exists():
+        return RatingsStore(database_path).query()
+    return pl.concat([read_results_file(f) for f in sorted(Path(results_path).glob("*.jsonl"))])
@@ -0,0 +1,96 @@
+import hashlib
+from pathlib import Path
+
+import polars as pl
+
+generation_path = Path("results/generation")
+store_path = Path("data/cache/generation")
+
+
+def file_hash(filepath):
+    return hashlib.sha1(Path(filepath).read_bytes()).hexdigest()
+
+
+def extract_joke(column="generated"):
+    """Joke text inside the first JSON object of the model output."""
+    return (pl.col(column)
+            .str.extract(r"\{[^}]+\}", 0)
+            .str.extract(r"\"trocadilho\":\s?\"(.*)\"", 1))
+
+
+def parse_generation_file(filepath):
+    model_name = Path(filepath).stem
+    return (pl.read_ndjson(filepath)
+            .select(pl.col("id").alias("headline_id"),
+                    pl.col("headline"),
+                    pl.col("pun sign"),
+                    pl.col("alternative sign"),
+                    extract_joke().alias("generated"),
+                    pl.lit(model_name).alias("model"),
+                    pl.lit(model_name.split("_")[0]).alias("base model"),
+                    pl.lit("_fewshot" in model_name).alias("few shot"),
+                    pl.lit("_definitions" in model_name).alias("definitions")))
+
+
+def ingest(results_path=generation_path, store=store_path, score=True):
+    """
+    Parse every generation file into a Parquet partition at
+    `store/<model>/<file hash>.parquet`, or `<file hash>-unscored.parquet`
+    without `score`. Files whose content did not change since the last
+    ingest are skipped (unless they were ingested without scores and are
+    now scored), and partitions of older versions of a file (or of deleted
+    files) are removed. Returns the new partitions.
+    """
+    filepaths = sorted(Path(results_path).glob("*.jsonl"))
+    models = {filepath.stem for filepath in filepaths}
+    for stale in Path(store).glob("*/*.parquet"):
+        if stale.parent.name not in models:
+            stale.unlink()
+
+    new_partitions = list()
+    for filepath in filepaths:
+        partition_dir = Path(store) / filepath.stem
+        source_hash = file_hash(filepath)
+        scored_partition = partition_dir / f"{source_hash}.parquet"
+        partition = (scored_partition if score
+                     else partition_dir / f"{source_hash}-unscored.parquet")
+        # A scored partition also serves unscored ingests
+        if partition.exists() or scored_partition.exists():
+            continue
+
+        print(f"Ingesting {filepath}")
+        df = parse_generation_file(filepath)
+        if score:
+            from full_pun_generation.scoring import (semantic_similarity,
+                                                     typicality)
+            scored = df.filter(pl.col("generated").is_not_null())
+            scored = scored.with_columns(
+                pl.Series("similarity",
+                          semantic_similarity(scored["headline"],
+                                              scored["generated"]),
+                          dtype=pl.Float64),
+                pl.Series("typicality", typicality(scored["generated"]),
+                          dtype=pl.Float64))
+            df = pl.concat([scored, df.filter(pl.col("generated").is_null())],
+                           how="diagonal")
+        else:
+            df = df.with_columns(pl.lit(None, pl.Float64).alias("similarity"),
+                                 pl.lit(None, pl.Float64).alias("typicality"))
+
+        partition_dir.mkdir(exist_ok=True, parents=True)
+        for stale in partition_dir.glob("*.parquet"):
+            stale.unlink()
+        (df.with_columns(pl.lit(source_hash).alias("source hash"))
+         .write_parquet(partition))
+        new_partitions.append(partition)
+    return new_partitions
+
+
+def scan_results(store=store_path, partitions=None):
+    """
+    Lazily scan the ingested results, either every partition in the
+    store or only the given ones (e.g. those returned by `ingest`).
+    """
+    if partitions is None:
+        partitions = sorted(Path(store).glob("*/*.parquet"))
+    return pl.scan_parquet(list(partitions))
@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import re
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from full_pun_generation.wordnet import sts_model, sts_model_name
+
+cache_dir = Path("data/cache")
+typicality_model_name = "Superar/pun-recognition-pt"
+# Weight of the headline similarity in the joke score (the rest is typicality)
+similarity_weight = 0.5
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _cache_filepath(name):
+    return cache_dir / f"{re.sub(r'[^A-Za-z0-9_.-]', '-', name)}.npz"
+
+
+def _load_cache(name, field):
+    """Text hashes and their cached `field` array, if cached."""
+    cache_filepath = _cache_filepath(name)
+    if not cache_filepath.exists():
+        return np.array([], dtype=str), None
+    with np.load(cache_filepath) as cache:
+        return cache["keys"], cache[field]
+
+
+def _save_cache(name, field, keys, values):
+    cache_filepath = _cache_filepath(name)
+    cache_filepath.parent.mkdir(exist_ok=True, parents=True)
+    np.savez(cache_filepath, keys=keys, **{field: values})
+
+
+def _missing_texts(texts, keys, index):
+    """Unique texts whose hash is not in `index`, in order of appearance."""
+    missing = dict()
+    for key, text in zip(keys, texts):
+        if key not in index and key not in missing:
+            missing[key] = text
+    return missing
+
+
+def encode(texts, batch_size=256, use_cache=True):
+    """
+    Normalized sentence embeddings for `texts`, one row per text.
+    Each unique text is encoded once and embeddings are cached on disk
+    so reruns only encode new texts.
+    """
+    texts = list(texts)
+    keys = [text_hash(t) for t in texts]
+    cached_keys, cached_embeddings = (
+        _load_cache(sts_model_name, "embeddings") if use_cache
+        else (np.array([], dtype=str), None))
+    index = {k: i for i, k in enumerate(cached_keys)}
+
+    missing = _missing_texts(texts, keys, index)
+    logging.info(f"Encoding {len(missing)} new texts ({len(index)} cached)")
+    if missing:
+        embeddings = np.asarray(sts_model.encode(list(missing.values()),
+                                                 batch_size=batch_size),
+                                dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        offset = len(index)
+        index.update({k: offset + i for i, k in enumerate(missing)})
+        cached_keys = np.concatenate([cached_keys, list(missing)])
+        cached_embeddings = (embeddings if cached_embeddings is None
+                             else np.concatenate([cached_embeddings, embeddings]))
+        if use_cache:
+            _save_cache(sts_model_name, "embeddings", cached_keys, cached_embeddings)
+
+    if not texts:
+        return np.empty((0, 0), dtype=np.float32)
+    return cached_embeddings[[index[k] for k in keys]]
+
+
+def semantic_similarity(texts1, texts2, batch_size=256, use_cache=True):
+    """Row-aligned cosine similarity between two sequences of texts."""
+    embeddings1 = encode(texts1, batch_size, use_cache)
+    embeddings2 = encode(texts2, batch_size, use_cache)
+    return np.einsum("ij,ij->i", embeddings1, embeddings2)
+
+
+@lru_cache(maxsize=None)
+def get_typicality_model():
+    from transformers import pipeline
+    return pipeline("text-classification", model=typicality_model_name)
+
+
+def typicality(texts, batch_size=64, use_cache=True, save_every=100):
+    """
+    Pun recognition score for each text. Unique texts are scored in
+    batches of similar length and scores are cached on disk, being saved
+    every `save_every` batches so long runs can be interrupted.
+    """
+    texts = list(texts)
+    keys = [text_hash(t) for t in texts]
+    cached_keys, cached_scores = (
+        _load_cache(typicality_model_name, "scores") if use_cache
+        else (np.array([], dtype=str), None))
+    scores = dict(zip(cached_keys.tolist(),
+                      [] if cached_scores is None else cached_scores.tolist()))
+
+    missing = _missing_texts(texts, keys, scores)
+    logging.info(f"Scoring {len(missing)} new texts ({len(scores)} cached)")
+    # Sorting by length keeps padding low inside each batch
+    missing = sorted(missing.items(), key=lambda x: len(x[1]))
+    for n, i in enumerate(range(0, len(missing), batch_size), start=1):
+        batch = missing[i:i+batch_size]
+        predictions = get_typicality_model()([text for _, text in batch],
+                                             batch_size=batch_size,
+                                             truncation=True)
+        scores.update({key: p["score"] for (key, _), p in zip(batch, predictions)})
+        if use_cache and (n % save_every == 0 or i + batch_size >= len(missing)):
+            _save_cache(typicality_model_name, "scores",
+                        np.array(list(scores), dtype=str),
+                        np.array(list(scores.values()), dtype=np.float64))
+    return np.array([scores[k] for k in keys], dtype=np.float64)
+
+
+def score_jokes(headlines, jokes, batch_size=64, use_cache=True):
+    """
+    Similarity of each joke to its headline, its typicality and the joke
+    score (their weighted mean), used to pick the best jokes.
+    """
+    similarity = semantic_similarity(headlines, jokes, use_cache=use_cache)
+    typicality_scores = typicality(jokes, batch_size, use_cache)
+    score = similarity_weight * similarity + (1 - similarity_weight) * typicality_scores
+    return similarity, typicality_scores, score
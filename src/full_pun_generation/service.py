@@ -0,0 +1,258 @@
+import asyncio
+import json
+import queue
+import time
+from argparse import ArgumentParser
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from full_pun_generation.pipeline import (Pipeline, Stage, T5Generator,
+                                          sign_prompt, sign_stages)
+from full_pun_generation.signs import SignsCache
+
+warm_up_headline = "Restos de salmoura no asteroide Bennu contêm minerais essenciais para a vida."
+
+
+class PunService():
+    """
+    Resident sign and generation pipelines behind the HTTP endpoints.
+    Concurrent requests share the micro-batches of each stage, and
+    identical work in flight (the signs of a headline, the joke of a
+    sign) is only submitted once. Each stage has its own timeout,
+    counted from when an item reaches it: `signs_timeout` seconds for
+    each sign stage and `generation_timeout` for generation, unless set
+    in `stage_timeouts`. Work no request waits for anymore is dropped
+    from the pipelines, and new work is refused while the first queue
+    of a pipeline is full.
+    """
+    def __init__(self, generate, cache=None, signs_timeout=10.0,
+                 generation_timeout=30.0, batch_size=16, max_wait=0.01,
+                 stage_timeouts=None, queue_size=256):
+        self.signs = Pipeline(sign_stages(cache, max_wait=max_wait), queue_size)
+        self.generation = Pipeline([Stage("generation", generate, batch_size, max_wait)],
+                                   queue_size)
+        self.timeouts = {**{stage.name: signs_timeout for stage in self.signs.stages},
+                         "generation": generation_timeout,
+                         **(stage_timeouts or dict())}
+        # Key -> [asyncio future, pipeline future, number of waiting requests]
+        self.inflight = dict()
+        self.coalesced = 0
+        self.rejected = 0
+
+    def warm_up(self):
+        """Load every model before the first request."""
+        item = self.signs.map([{"headline": warm_up_headline}])[0]
+        self.generation.map([sign_prompt(sign) for sign in item["signs"][:1]])
+
+    async def _wait(self, entry, pipeline):
+        """
+        Result of a pipeline future, or asyncio.TimeoutError with the name
+        of the stage its item spent longer than the stage timeout in.
+        """
+        while True:
+            i, since = entry[1].progress
+            stage = pipeline.stages[i].name
+            remaining = since + self.timeouts[stage] - time.perf_counter()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(stage)
+            try:
+                return await asyncio.wait_for(asyncio.shield(entry[0]), remaining)
+            except asyncio.TimeoutError:
+                # The item may have moved on to the next stage meanwhile
+                continue
+
+    async def _run(self, key, pipeline, item):
+        """Result of `item`; raises queue.Full if the pipeline is full."""
+        entry = self.inflight.get(key)
+        if entry is None:
+            try:
+                future = pipeline.submit(item, block=False)
+            except queue.Full:
+                self.rejected += 1
+                raise
+            entry = [asyncio.wrap_future(future), future, 0]
+            self.inflight[key] = entry
+        else:
+            self.coalesced += 1
+        entry[2] += 1
+        try:
+            return await self._wait(entry, pipeline)
+        finally:
+            entry[2] -= 1
+            if entry[2] == 0:
+                if self.inflight.get(key) is entry:
+                    del self.inflight[key]
+                if not entry[0].done():
+                    entry[1].cancel()
+
+    async def _joke(self, prompt):
+        key = ("joke", *prompt.values())
+        return {**prompt, "joke": await self._run(key, self.generation, prompt)}
+
+    async def events(self, headline, max_jokes=3):
+        """
+        Signs of `headline`, then its jokes as they are generated, then a
+        summary, as a stream of events. The stream ends early with an
+        "overloaded" event if the signs pipeline is full, or with a
+        "timeout" or "error" event if the signs are not found.
+        """
+        start = time.perf_counter()
+        try:
+            item = await self._run(("signs", headline), self.signs, {"headline": headline})
+        except queue.Full:
+            yield {"event": "overloaded", "latency": time.perf_counter() - start}
+            return
+        except asyncio.TimeoutError as e:
+            yield {"event": "timeout", "stage": e.args[0],
+                   "latency": time.perf_counter() - start}
+            return
+        except Exception as e:
+            yield {"event": "error", "stage": "signs", "error": repr(e),
+                   "latency": time.perf_counter() - start}
+            return
+        yield {"event": "signs", "signs": item["signs"],
+               "latency": time.perf_counter() - start}
+
+        tasks = [asyncio.ensure_future(self._joke(sign_prompt(sign)))
+                 for sign in item["signs"][:max_jokes]]
+        try:
+            for next_joke in asyncio.as_completed(tasks):
+                try:
+                    joke = await next_joke
+                except asyncio.TimeoutError as e:
+                    yield {"event": "timeout", "stage": e.args[0],
+                           "latency": time.perf_counter() - start}
+                    continue
+                except queue.Full:
+                    yield {"event": "error", "stage": "generation",
+                           "error": "Generation queue is full"}
+                    continue
+                except Exception as e:
+                    yield {"event": "error", "stage": "generation", "error": repr(e)}
+                    continue
+                yield {"event": "joke", **joke, "latency": time.perf_counter() - start}
+        finally:
+            for task in tasks:
+                task.cancel()
+        yield {"event": "done", "latency": time.perf_counter() - start}
+
+    def stats(self):
+        return {"in flight": len(self.inflight),
+                "coalesced": self.coalesced,
+                "rejected": self.rejected,
+                "signs": self.signs.report().to_dicts(),
+                "generation": self.generation.report().to_dicts()}
+
+    def close(self):
+        self.signs.close()
+        self.generation.close()
+
+
+class PunRequest(BaseModel):
+    headline: str
+    max_jokes: int = 3
+    stream: bool = False
+
+
+async def _chain(first, events):
+    yield first
+    async for event in events:
+        yield event
+
+
+def create_app(make_service):
+    """HTTP app around the service built by `make_service` at startup."""
+    @asynccontextmanager
+    async def lifespan(app):
+        app.state.service = make_service()
+        yield
+        app.state.service.close()
+
+    app = FastAPI(title="Pun generation", lifespan=lifespan)
+
+    @app.post("/puns")
+    async def puns(request: PunRequest):
+        events = app.state.service.events(request.headline, request.max_jokes)
+        # The first event tells whether the request was accepted at all
+        first = await events.__anext__()
+        if first["event"] == "overloaded":
+            raise HTTPException(503, "Too many requests in flight, try again later")
+        if request.stream:
+            lines = (json.dumps(event, ensure_ascii=False) + "\n"
+                     async for event in _chain(first, events))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+        response = {"headline": request.headline, "signs": None, "jokes": list(),
+                    "timeouts": list(), "errors": list()}
+        async for event in _chain(first, events):
+            if event["event"] == "signs":
+                response["signs"] = event["signs"]
+            elif event["event"] == "joke":
+                response["jokes"].append({key: value for key, value in event.items()
+                                          if key not in ("event", "latency")})
+            elif event["event"] == "timeout":
+                response["timeouts"].append(event["stage"])
+            elif event["event"] == "error":
+                response["errors"].append(event["error"])
+            if "latency" in event and event["event"] != "joke":
+                response["latency"] = event["latency"]
+        if response["signs"] is None and response["errors"]:
+            raise HTTPException(500, f"Sign discovery failed: {response['errors'][0]}")
+        if response["signs"] is None:
+            raise HTTPException(504, f"Timed out looking for signs ({response['timeouts'][0]})")
+        return response
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def stats():
+        return app.state.service.stats()
+
+    return app
+
+
+def parse_args():
+    parser = ArgumentParser(description="Serve pun generation for live headlines")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--signs_timeout", type=float, default=10.0,
+                        help="Seconds a headline may spend in each sign stage")
+    parser.add_argument("--generation_timeout", type=float, default=30.0,
+                        help="Seconds a sign may spend in the generation stage")
+    parser.add_argument("--stage_timeout", nargs=2, action="append", default=list(),
+                        metavar=("STAGE", "SECONDS"),
+                        help="Timeout of a single stage, e.g. --stage_timeout keywords 2")
+    parser.add_argument("--queue_size", type=int, default=256,
+                        help="Items waiting in each stage before new requests are refused")
+    parser.add_argument("--batch_size", type=int, default=16,
+                        help="Maximum jokes generated in one batch")
+    parser.add_argument("--max_wait", type=float, default=0.01,
+                        help="Seconds each stage waits to fill a micro-batch")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    return parser.parse_args()
+
+
+def main():
+    import uvicorn
+
+    args = parse_args()
+
+    def make_service():
+        service = PunService(T5Generator(args.max_new_tokens), SignsCache(),
+                             args.signs_timeout, args.generation_timeout,
+                             args.batch_size, args.max_wait,
+                             {stage: float(seconds) for stage, seconds in args.stage_timeout},
+                             args.queue_size)
+        service.warm_up()
+        return service
+
+    uvicorn.run(create_app(make_service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
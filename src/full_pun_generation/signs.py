@@ -0,0 +1,334 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+from itertools import combinations
+from pathlib import Path
+
+cache_path = Path("data/cache/signs.db")
+
+# Maximum number of homophone spellings checked for each word
+max_spellings = 50
+# Near-homophones and multi-word segmentations (from the lexicon, if it
+# was built) kept for each word, and the maximum phoneme edit distance of
+# near-homophones
+max_near_homophones = 10
+near_homophone_distance = 1
+max_segmentations = 5
+
+
+class SignsCache():
+    """
+    Persistent cache of what is computed for each keyword (its expansion)
+    and each word (its candidate signs), in a SQLite database. Entries
+    older than `ttl` seconds are recomputed and, once there are more than
+    `max_entries`, the least recently used ones are evicted. Hits and
+    misses are counted per namespace to help sizing it.
+    """
+    def __init__(self, filepath=cache_path, max_entries=100000,
+                 ttl=30 * 24 * 60 * 60):
+        self.filepath = Path(filepath)
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = Counter()
+        self.misses = Counter()
+        self.evictions = 0
+        # The cache can be shared by the threads of a pipeline
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(self.filepath, check_same_thread=False)
+        with self.connection as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (namespace, key))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_used "
+                         "ON entries (used_at)")
+
+    def get_many(self, namespace, keys):
+        """Cached values of the `keys` found and not expired."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        found = dict()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i+500]
+                rows = self.connection.execute(
+                    f"SELECT key, value FROM entries WHERE namespace = ? "
+                    f"AND created_at >= ? AND key IN ({', '.join('?' * len(batch))})",
+                    [namespace, now - self.ttl, *batch])
+                found.update((key, json.loads(value)) for key, value in rows)
+            with self.connection as conn:
+                conn.executemany("UPDATE entries SET used_at = ? "
+                                 "WHERE namespace = ? AND key = ?",
+                                 [(now, namespace, key) for key in found])
+            self.hits[namespace] += len(found)
+            self.misses[namespace] += len(keys) - len(found)
+        return found
+
+    def put_many(self, namespace, values):
+        now = time.time()
+        with self._lock:
+            with self.connection as conn:
+                conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                 [(namespace, key, json.dumps(value, ensure_ascii=False),
+                                   now, now)
+                                  for key, value in values.items()])
+            self.evict()
+
+    def evict(self):
+        with self._lock, self.connection as conn:
+            expired = conn.execute("DELETE FROM entries WHERE created_at < ?",
+                                   [time.time() - self.ttl]).rowcount
+            lru = conn.execute("""
+                DELETE FROM entries WHERE rowid IN (
+                    SELECT rowid FROM entries ORDER BY used_at DESC
+                    LIMIT -1 OFFSET ?)""", [self.max_entries]).rowcount
+            self.evictions += expired + lru
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        lookups = {ns: self.hits[ns] + self.misses[ns] for ns in namespaces}
+        return {"entries": len(self),
+                "evictions": self.evictions,
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "hit rate": {ns: self.hits[ns] / lookups[ns] if lookups[ns] else 0.0
+                             for ns in namespaces}}
+
+
+def signs_namespace():
+    """
+    Cache namespace of the word signs, which depend on the settings above
+    and on the lexicon: signs found without it, or with another build of
+    it, are not reused.
+    """
+    from full_pun_generation.lexicon import lexicon_path
+
+    lexicon = "nolex"
+    if lexicon_path.exists():
+        lexicon = f"lex{lexicon_path.stat().st_mtime_ns:x}"
+    return (f"signs-{max_spellings}-{max_near_homophones}-"
+            f"{near_homophone_distance}-{max_segmentations}-{lexicon}")
+
+
+def expand(keywords, cache=None):
+    """Words related to each keyword, including the keyword itself."""
+    from full_pun_generation.context import similar_words
+
+    keywords = [kw for kw, _ in keywords]
+    cached = cache.get_many("expansion", keywords) if cache is not None else dict()
+    new_keywords = [kw for kw in dict.fromkeys(keywords) if kw not in cached]
+    similar = similar_words(new_keywords)
+    missing = {kw: [kw] + [w for w, _ in similar.get(kw, [])] for kw in new_keywords}
+    if cache is not None and missing:
+        cache.put_many("expansion", missing)
+    return {**cached, **missing}
+
+
+def homographic_signs(words):
+    """Least similar definitions (and their similarity) of the ambiguous words."""
+    from full_pun_generation.wordnet import get_ambiguous_words
+
+    return {w: [float(similarity), str(def1), str(def2)]
+            for w, similarity, def1, def2 in get_ambiguous_words(words) if w}
+
+
+def homophone_signs(pronunciations):
+    """Pairs of valid spellings (with their definitions) of each pronunciation."""
+    from full_pun_generation.pronunciation import phoneme_to_grapheme
+    from full_pun_generation.wordnet import (get_definitions_similarity,
+                                             get_valid_words,
+                                             get_words_synsets)
+
+    signs = {w: list() for w in pronunciations}
+    for w, pron in pronunciations.items():
+        graphemes = get_valid_words(phoneme_to_grapheme(pron, top_k=max_spellings)[1])
+        if len(graphemes) < 2:
+            continue
+        for w1, w2 in combinations(graphemes, 2):
+            w1, w2 = str(w1), str(w2)
+            if w1 == w2:
+                continue
+            synsets = get_words_synsets([w1, w2])
+            _, def1, def2 = get_definitions_similarity(synsets[0], synsets[1])
+            signs[w].append([[w1, str(def1)], [w2, str(def2)]])
+    return signs
+
+
+def lexicon_signs(pronunciations):
+    """
+    Near-homophone and multi-word signs of each word, when the lexicon
+    was built.
+    """
+    from full_pun_generation.lexicon import (get_near_homophone_index,
+                                             get_phoneme_trie, lexicon_path)
+    from full_pun_generation.pronunciation import encode_pronunciation
+    from full_pun_generation.wordnet import (get_definitions_similarity,
+                                             get_valid_words,
+                                             get_words_synsets)
+
+    signs = {w: {"near homophones": list(), "segmentations": list()}
+             for w in pronunciations}
+    if not pronunciations or not lexicon_path.exists():
+        return signs
+    index = get_near_homophone_index(near_homophone_distance)
+    trie = get_phoneme_trie()
+    valid_words = set(get_valid_words(list(pronunciations)))
+    for w, pron in pronunciations.items():
+        if w not in valid_words or not pron:
+            continue
+        codes = encode_pronunciation(pron)
+        near_homophones = [other for other, distance in index.query(codes)
+                           if distance > 0 and other != w][:max_near_homophones]
+        for other in near_homophones:
+            synsets = get_words_synsets([w, other])
+            _, def1, def2 = get_definitions_similarity(synsets[0], synsets[1])
+            signs[w]["near homophones"].append([[w, str(def1)], [other, str(def2)]])
+
+        for segmentation in trie.segmentations(codes, limit=max_segmentations):
+            synsets = get_words_synsets([w, *segmentation])
+            if not all(synsets[1:]):
+                continue
+            # Definition of the word most unlike those of the segment words
+            _, def1, _ = get_definitions_similarity(
+                synsets[0], [s for segment in synsets[1:] for s in segment])
+            def2 = "; ".join(segment[0].definition() for segment in synsets[1:])
+            signs[w]["segmentations"].append([[w, str(def1)],
+                                              [" ".join(segmentation), str(def2)]])
+    return signs
+
+
+def word_signs(words):
+    """
+    Homographic definitions (with their similarity), homophone signs and,
+    when the lexicon was built, near-homophone and multi-word signs of
+    each word, computed for all words at once.
+    """
+    from full_pun_generation.pronunciation import get_pronunciation
+
+    words = list(words)
+    if not words:
+        return dict()
+    homographic = homographic_signs(words)
+    pronunciations = dict(zip(words, get_pronunciation(words)))
+    homophones = homophone_signs(pronunciations)
+    lexicon = lexicon_signs(pronunciations)
+    return {w: {"homographic": homographic.get(w), "homophones": homophones[w],
+                **lexicon[w]}
+            for w in words}
+
+
+def combine_signs(words, entries):
+    """
+    Signs of a text from the entries of its words: homographic signs
+    (most ambiguous first), then the homophone, near-homophone and
+    multi-word ones.
+    """
+    homographic = sorted(((w, *entries[w]["homographic"]) for w in words
+                          if entries[w]["homographic"]),
+                         key=lambda x: x[1])
+    signs = [[[w, def1], [w, def2]] for w, _, def1, def2 in homographic]
+    for kind in ["homophones", "near homophones", "segmentations"]:
+        for w in words:
+            for sign in entries[w][kind]:
+                if sign not in signs:
+                    signs.append(sign)
+    return signs
+
+
+# Each step below processes a batch of texts (dicts with a "headline")
+# at once, adding what it finds to each dict. `get_signs` runs them one
+# after the other for a single text, and `full_pun_generation.pipeline`
+# runs them as concurrent stages.
+
+def _batch_words(items, key="missing"):
+    return list(dict.fromkeys(w for item in items for w in item[key]))
+
+
+def find_keywords(items, n_keywords=5):
+    from full_pun_generation.context import extract_keywords_batch
+
+    keywords = extract_keywords_batch([item["headline"] for item in items], n_keywords)
+    for item, kws in zip(items, keywords):
+        item["keywords"] = kws
+    return items
+
+
+def find_words(items, cache=None):
+    """Expanded keywords, split into those with cached signs and the missing ones."""
+    expansions = expand([kw for item in items for kw in item["keywords"]], cache)
+    for item in items:
+        item["words"] = {w for kw, _ in item["keywords"] for w in expansions[kw]}
+    words = _batch_words(items, "words")
+    cached = cache.get_many(signs_namespace(), words) if cache is not None else dict()
+    for item in items:
+        item["entries"] = {w: cached[w] for w in item["words"] if w in cached}
+        item["missing"] = [w for w in item["words"] if w not in cached]
+    return items
+
+
+def find_homographs(items):
+    homographic = homographic_signs(_batch_words(items))
+    for item in items:
+        item["homographic"] = {w: homographic.get(w) for w in item["missing"]}
+    return items
+
+
+def find_pronunciations(items):
+    from full_pun_generation.pronunciation import get_pronunciation
+
+    words = _batch_words(items)
+    pronunciations = dict(zip(words, get_pronunciation(words))) if words else dict()
+    for item in items:
+        item["pronunciations"] = {w: pronunciations[w] for w in item["missing"]}
+    return items
+
+
+def find_homophones(items):
+    pronunciations = {w: pron for item in items
+                      for w, pron in item["pronunciations"].items()}
+    homophones = homophone_signs(pronunciations)
+    lexicon = lexicon_signs(pronunciations)
+    for item in items:
+        item["new"] = {w: {"homographic": item["homographic"][w],
+                           "homophones": homophones[w], **lexicon[w]}
+                       for w in item["missing"]}
+    return items
+
+
+def assemble_signs(items, cache=None):
+    """Signs of each text, caching those of the new words."""
+    new = {w: entry for item in items for w, entry in item["new"].items()}
+    if cache is not None and new:
+        cache.put_many(signs_namespace(), new)
+    for item in items:
+        logging.info(f"Signs of {len(item['new'])} new words "
+                     f"({len(item['entries'])} cached)")
+        item["signs"] = combine_signs(item["words"], {**item["entries"], **item["new"]})
+    return items
+
+
+def get_signs(text, n_keywords=5, cache=None):
+    """
+    Homographic and homophone signs for the keywords of `text` and their
+    expansions. With a `cache`, each keyword and word is only processed
+    the first time it is seen.
+    """
+    items = [{"headline": text}]
+    items = find_keywords(items, n_keywords)
+    items = find_words(items, cache)
+    items = find_homographs(items)
+    items = find_pronunciations(items)
+    items = find_homophones(items)
+    return assemble_signs(items, cache)[0]["signs"]
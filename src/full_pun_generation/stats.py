@@ -0,0 +1,214 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from multiprocessing import get_context
+
+import numpy as np
+import polars as pl
+
+
+def reliability_data(df, value, rater="evaluator", item="headline_id",
+                     group="model"):
+    """
+    Dense group x rater x item matrix of ordinal `value` codes, with NaN
+    where a rater did not rate an item. Returns the matrix and the group,
+    rater and item labels of each axis.
+    """
+    df = df.filter(pl.col(value).is_not_null())
+    groups, group_idx = np.unique(df[group].to_numpy(), return_inverse=True)
+    raters, rater_idx = np.unique(df[rater].to_numpy(), return_inverse=True)
+    items, item_idx = np.unique(df[item].to_numpy(), return_inverse=True)
+    data = np.full((len(groups), len(raters), len(items)), np.nan)
+    data[group_idx, rater_idx, item_idx] = df[value].to_numpy()
+    return data, groups, raters, items
+
+
+def category_counts(data, categories):
+    """Number of ratings of each category along the last axis of `data`."""
+    return np.stack([(data == c).sum(axis=-1) for c in categories], axis=-1)
+
+
+def ordinal_alpha(counts):
+    """
+    Krippendorff's alpha for ordinal data from per-unit category counts
+    of shape (..., units, categories), computed over all leading axes.
+    """
+    counts = counts.astype(float)
+    pairable = counts.sum(axis=-1, keepdims=True)
+    counts = np.where(pairable >= 2, counts, 0)
+    weights = np.divide(1, pairable - 1, out=np.zeros_like(pairable),
+                        where=pairable >= 2)
+
+    # Coincidence matrix and category totals
+    weighted = counts * weights
+    coincidences = np.einsum("...uc,...uk->...ck", weighted, counts)
+    diagonal = np.arange(counts.shape[-1])
+    coincidences[..., diagonal, diagonal] -= weighted.sum(axis=-2)
+    n_c = coincidences.sum(axis=-1)
+    n = n_c.sum(axis=-1)
+
+    # Ordinal metric: squared number of values between the two categories
+    cumulative = np.cumsum(n_c, axis=-1)
+    between = (cumulative[..., None, :] - cumulative[..., :, None]
+               + n_c[..., :, None])
+    between = np.where(diagonal[:, None] <= diagonal[None, :], between,
+                       np.swapaxes(between, -1, -2))
+    distance = (between - (n_c[..., :, None] + n_c[..., None, :]) / 2) ** 2
+
+    observed = (coincidences * distance).sum(axis=(-1, -2))
+    expected = (n_c[..., :, None] * n_c[..., None, :] * distance).sum(axis=(-1, -2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - (n - 1) * observed / expected
+
+
+def tastle_wierman_consensus(counts, categories):
+    """
+    Tastle and Wierman's consensus from category counts of shape
+    (..., categories). The width of the scale is the number of observed
+    categories minus one.
+    """
+    categories = np.asarray(categories, dtype=float)
+    n = counts.sum(axis=-1, keepdims=True)
+    p = counts / n
+    mu = (p * categories).sum(axis=-1, keepdims=True)
+    width = (counts > 0).sum(axis=-1, keepdims=True) - 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        term = p * np.log2(1 - np.abs(categories - mu) / width)
+    consensus = 1 + np.where(counts > 0, term, 0).sum(axis=-1)
+    return np.where(width[..., 0] == 0, 1.0, consensus)
+
+
+def median(counts, categories):
+    """Median (nearest rank) of the ratings from category counts."""
+    categories = np.asarray(categories)
+    n = counts.sum(axis=-1, keepdims=True)
+    rank = np.floor(0.5 * (n - 1) + 0.5)
+    return categories[(np.cumsum(counts, axis=-1) > rank).argmax(axis=-1)]
+
+
+def _bootstrap_alpha(counts, seed, n_resamples):
+    rng = np.random.default_rng(seed)
+    n_units = counts.shape[-2]
+    indices = rng.integers(0, n_units, size=(n_resamples, n_units))
+    # (groups, resamples, units, categories)
+    return ordinal_alpha(counts[..., indices, :]).T
+
+
+def bootstrap_alpha(counts, n_resamples=1000, confidence=0.95, seed=0,
+                    workers=None, chunk_size=250):
+    """
+    Bootstrap confidence interval of the ordinal alpha, resampling units.
+    Resamples are split in chunks computed in parallel threads (NumPy
+    releases the GIL in the array operations); each chunk gets its own
+    seed from `seed`, so results are reproducible.
+    """
+    chunks = [min(chunk_size, n_resamples - i)
+              for i in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    with ThreadPoolExecutor(workers) as executor:
+        alphas = np.concatenate(list(executor.map(_bootstrap_alpha,
+                                                  [counts] * len(chunks),
+                                                  seeds, chunks)))
+    tail = (1 - confidence) / 2 * 100
+    return (np.nanpercentile(alphas, tail, axis=0),
+            np.nanpercentile(alphas, 100 - tail, axis=0))
+
+
+def agreement_summary(df, criteria, categories, group="model",
+                      n_resamples=1000, seed=0, workers=None):
+    """
+    Median, consensus and Krippendorff's alpha (with bootstrap interval)
+    of each criterion for every group, from one reliability matrix per
+    criterion.
+    """
+    summary = None
+    for criterion in criteria:
+        data, groups, _, _ = reliability_data(df, criterion, group=group)
+        unit_counts = category_counts(np.swapaxes(data, -1, -2), categories)
+        counts = unit_counts.sum(axis=-2)
+        alpha = ordinal_alpha(unit_counts)
+        low, high = (bootstrap_alpha(unit_counts, n_resamples, seed=seed,
+                                     workers=workers)
+                     if n_resamples else (np.nan, np.nan))
+        criterion_df = pl.DataFrame({
+            group: groups,
+            f"{criterion} median": median(counts, categories).astype(float),
+            f"{criterion} consensus": tastle_wierman_consensus(counts, categories),
+            f"{criterion} alpha": alpha,
+            f"{criterion} alpha low": np.broadcast_to(low, alpha.shape),
+            f"{criterion} alpha high": np.broadcast_to(high, alpha.shape)})
+        summary = (criterion_df if summary is None
+                   else summary.join(criterion_df, on=group, how="full",
+                                     coalesce=True))
+    return summary.sort(group)
+
+
+def group_scores(df, value, group="model", item="headline_id"):
+    """
+    Mean rating of every group on each item, averaged over raters. Items
+    not rated for every group are dropped, so the columns are paired.
+    """
+    data, groups, _, items = reliability_data(df, value, item=item, group=group)
+    rated = (~np.isnan(data)).any(axis=1)
+    scores = np.nansum(data, axis=1) / np.maximum((~np.isnan(data)).sum(axis=1), 1)
+    paired = rated.all(axis=0)
+    return scores[:, paired], groups, items[paired]
+
+
+def _resample_differences(differences, seed, n_resamples, method):
+    rng = np.random.default_rng(seed)
+    n_items = differences.shape[-1]
+    if method == "bootstrap":
+        indices = rng.integers(0, n_items, size=(n_resamples, n_items))
+        return differences[:, indices].mean(axis=-1)
+    # Paired permutation: swapping the two groups on an item flips the sign
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(n_resamples, n_items))
+    return differences @ signs.T / n_items
+
+
+def holm(p_values):
+    """Holm-Bonferroni adjusted p-values."""
+    p_values = np.asarray(p_values)
+    order = np.argsort(p_values)
+    m = len(p_values)
+    adjusted = np.maximum.accumulate((m - np.arange(m)) * p_values[order])
+    result = np.empty_like(adjusted)
+    result[order] = np.minimum(adjusted, 1)
+    return result
+
+
+def compare_groups(scores, groups, n_resamples=10000, confidence=0.95, seed=0,
+                   workers=None, chunk_size=1000):
+    """
+    Pairwise differences in mean score between groups, with a paired
+    bootstrap confidence interval and a paired permutation p-value for
+    each pair. Replicates are drawn as index/sign matrices in chunks, each
+    chunk with its own seed spawned from `seed` and computed in a process
+    pool, so results do not depend on the number of workers.
+    """
+    first, second = np.triu_indices(len(groups), k=1)
+    differences = scores[first] - scores[second]
+    observed = differences.mean(axis=-1)
+
+    chunks = [min(chunk_size, n_resamples - i)
+              for i in range(0, n_resamples, chunk_size)]
+    bootstrap_seeds, permutation_seeds = np.random.SeedSequence(seed).spawn(2)
+    with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as executor:
+        bootstrap = executor.map(_resample_differences, repeat(differences),
+                                 bootstrap_seeds.spawn(len(chunks)), chunks,
+                                 repeat("bootstrap"))
+        permutation = executor.map(_resample_differences, repeat(differences),
+                                   permutation_seeds.spawn(len(chunks)), chunks,
+                                   repeat("permutation"))
+        bootstrap = np.concatenate(list(bootstrap), axis=1)
+        permutation = np.concatenate(list(permutation), axis=1)
+
+    tail = (1 - confidence) / 2 * 100
+    extreme = np.abs(permutation) >= np.abs(observed)[:, None] - 1e-12
+    p_values = (extreme.sum(axis=1) + 1) / (n_resamples + 1)
+    return pl.DataFrame({"model": groups[first],
+                         "other model": groups[second],
+                         "difference": observed,
+                         "low": np.percentile(bootstrap, tail, axis=1),
+                         "high": np.percentile(bootstrap, 100 - tail, axis=1),
+                         "p-value": p_values,
+                         "adjusted p-value": holm(p_values)})
@@ -1,22 +1,96 @@
 import logging
+import os
+import sqlite3
+from argparse import ArgumentParser
+from collections import namedtuple
+from functools import lru_cache
+from pathlib import Path
 
 import numpy as np
 from nltk.corpus import wordnet as wn
 from sentence_transformers import SentenceTransformer
 
-sts_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+sts_model_name = "sentence-transformers/all-MiniLM-L6-v2"
+sts_model = SentenceTransformer(sts_model_name)
 
+# Words whose most distant definitions are less similar than this are ambiguous
+ambiguity_threshold = 0.2
+ambiguity_table_path = Path("data/cache/wordnet_ambiguity.db")
+store_path = Path("data/cache/wordnet_por.db")
 
-def get_ambiguous_words(words):
+
+class Synset(namedtuple("Synset", ["name", "gloss"])):
+    """Synset read from the local store, with NLTK's `definition()` accessor."""
+    def definition(self):
+        return self.gloss
+
+    def __repr__(self):
+        return f"Synset('{self.name}')"
+
+
+@lru_cache(maxsize=None)
+def _store_connection(filepath, pid):
+    # Read-only and memory-mapped, so processes share the pages of the file
+    conn = sqlite3.connect(f"file:{filepath}?mode=ro&immutable=1", uri=True,
+                           check_same_thread=False)
+    conn.execute("PRAGMA mmap_size = 268435456")
+    return conn
+
+
+def get_store():
+    """Connection to the local WordNet store, or None if it was not exported."""
+    if not store_path.exists():
+        return None
+    # One connection per process, as connections must not cross a fork
+    return _store_connection(store_path, os.getpid())
+
+
+def synsets(word):
+    """Portuguese synsets of `word`, in the same order as NLTK."""
+    store = get_store()
+    if store is None:
+        return wn.synsets(word, lang="por")
+    rows = store.execute("SELECT s.name, s.definition FROM lemmas l "
+                         "JOIN synsets s ON s.id = l.synset_id "
+                         "WHERE l.lemma = ? ORDER BY l.position",
+                         [word.lower()])
+    return [Synset(name, definition) for name, definition in rows]
+
+
+def lemma_names():
+    store = get_store()
+    if store is None:
+        return set(wn.all_lemma_names(lang="por"))
+    return {word for word, in store.execute("SELECT word FROM words")}
+
+
+@lru_cache(maxsize=None)
+def load_ambiguity_table(filepath=ambiguity_table_path):
+    """Lemma -> (min similarity, definition 1, definition 2)."""
+    with sqlite3.connect(filepath) as conn:
+        rows = conn.execute("SELECT lemma, similarity, definition1, definition2 "
+                            "FROM ambiguity").fetchall()
+    return {lemma: (similarity, def1, def2) for lemma, similarity, def1, def2 in rows}
+
+
+def get_ambiguous_words(words, threshold=ambiguity_threshold):
     logging.info(f"Checking ambiguous words from {words}")
     ambiguous_words = set()
+    if ambiguity_table_path.exists():
+        table = load_ambiguity_table(ambiguity_table_path)
+        for w in words:
+            min_similarity, def1, def2 = table.get(w.lower(), (None, None, None))
+            if min_similarity is not None and min_similarity < threshold:
+                ambiguous_words.add((w, min_similarity, def1, def2))
+        return sorted(ambiguous_words, key=lambda x: x[1])
+
     for w in words:
         logging.info(f"Checking word: {w}")
-        synsets = wn.synsets(w, lang="por")
-        if len(synsets) < 2:
+        word_synsets = synsets(w)
+        if len(word_synsets) < 2:
             continue
-        min_similarity, def1, def2 = get_definitions_similarity(synsets)
-        if min_similarity < 0.2:
+        min_similarity, def1, def2 = get_definitions_similarity(word_synsets)
+        if min_similarity < threshold:
             ambiguous_words.add((w, min_similarity, def1, def2))
     ambiguous_words = sorted(ambiguous_words, key=lambda x: x[1])
     return ambiguous_words
@@ -47,19 +121,155 @@ def get_definitions_similarity(synsets1, synsets2=None):
 
 
 def get_valid_words(words):
-    return [w for w in words if w in wn.words(lang="por")]
+    store = get_store()
+    if store is None:
+        valid_words = set(wn.words(lang="por"))
+    else:
+        words = list(words)
+        unique_words = list(dict.fromkeys(words))
+        valid_words = set()
+        # In batches, as older SQLite builds allow at most 999 variables
+        for i in range(0, len(unique_words), 500):
+            batch = unique_words[i:i+500]
+            valid_words.update(word for word, in store.execute(
+                f"SELECT word FROM words WHERE word IN ({', '.join('?' * len(batch))})",
+                batch))
+    return [w for w in words if w in valid_words]
 
 
 def get_words_synsets(words):
-    return [wn.synsets(w, lang="por") for w in words]
+    return [synsets(w) for w in words]
 
 
 def test():
     logging.basicConfig(level=logging.INFO)
     words = ["concelho", "zona", "vila", "português"]
     for w in words:
-        synsets = wn.synsets(w, lang="por")
-        logging.info(synsets)
-        logging.info(get_definitions_similarity(synsets))
+        word_synsets = synsets(w)
+        logging.info(word_synsets)
+        logging.info(get_definitions_similarity(word_synsets))
     ambiguous_words = get_ambiguous_words(words)
     logging.info(f"Ambiguous words: {ambiguous_words}")
+
+
+def build_ambiguity_table(filepath=ambiguity_table_path, batch_size=256, workers=1):
+    """
+    Most distant pair of definitions of every Portuguese lemma with two or
+    more synsets. Each definition is encoded once, in batches spread over
+    `workers` processes, and the table keeps the similarity itself so the
+    threshold can be changed without recomputing it.
+    """
+    lemma_synsets = dict()
+    for lemma in sorted({lemma.lower() for lemma in lemma_names()}):
+        lemma_synsets[lemma] = synsets(lemma)
+        if len(lemma_synsets[lemma]) < 2:
+            del lemma_synsets[lemma]
+    definitions = sorted({s.definition() for word_synsets in lemma_synsets.values()
+                          for s in word_synsets})
+    logging.info(f"Encoding {len(definitions)} definitions of "
+                 f"{len(lemma_synsets)} lemmas")
+
+    if workers > 1:
+        pool = sts_model.start_multi_process_pool(["cpu"] * workers)
+        embeddings = sts_model.encode_multi_process(definitions, pool,
+                                                    batch_size=batch_size)
+        sts_model.stop_multi_process_pool(pool)
+    else:
+        embeddings = sts_model.encode(definitions, batch_size=batch_size,
+                                      show_progress_bar=True)
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    index = {d: i for i, d in enumerate(definitions)}
+
+    rows = list()
+    for lemma, word_synsets in lemma_synsets.items():
+        lemma_definitions = [s.definition() for s in word_synsets]
+        lemma_embeddings = embeddings[[index[d] for d in lemma_definitions]]
+        similarity = lemma_embeddings @ lemma_embeddings.T
+        i, j = np.unravel_index(similarity.argmin(), similarity.shape)
+        rows.append((lemma, float(similarity[i, j]),
+                     lemma_definitions[i], lemma_definitions[j]))
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(exist_ok=True, parents=True)
+    with sqlite3.connect(filepath) as conn:
+        conn.execute("DROP TABLE IF EXISTS ambiguity")
+        conn.execute("""
+            CREATE TABLE ambiguity (
+                lemma TEXT PRIMARY KEY,
+                similarity REAL NOT NULL,
+                definition1 TEXT NOT NULL,
+                definition2 TEXT NOT NULL) WITHOUT ROWID""")
+        conn.executemany("INSERT INTO ambiguity VALUES (?, ?, ?, ?)", rows)
+    conn.close()
+    load_ambiguity_table.cache_clear()
+    return len(rows)
+
+
+def export_wordnet(filepath=store_path):
+    """
+    Write the Portuguese lemmas, their synsets (in NLTK's order) and the
+    synset definitions to a SQLite store read by this module instead of
+    NLTK's OMW loader.
+    """
+    names = set(wn.all_lemma_names(lang="por"))
+    synset_ids, lemma_rows = dict(), list()
+    for lemma in sorted({name.lower() for name in names}):
+        for position, synset in enumerate(wn.synsets(lemma, lang="por")):
+            synset_id = synset_ids.setdefault(synset, len(synset_ids))
+            lemma_rows.append((lemma, position, synset_id))
+
+    filepath = Path(filepath)
+    filepath.parent.mkdir(exist_ok=True, parents=True)
+    filepath.unlink(missing_ok=True)
+    conn = sqlite3.connect(filepath)
+    with conn:
+        conn.execute("CREATE TABLE words (word TEXT PRIMARY KEY) WITHOUT ROWID")
+        conn.execute("""
+            CREATE TABLE synsets (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                definition TEXT NOT NULL)""")
+        conn.execute("""
+            CREATE TABLE lemmas (
+                lemma TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                synset_id INTEGER NOT NULL REFERENCES synsets (id),
+                PRIMARY KEY (lemma, position)) WITHOUT ROWID""")
+        conn.executemany("INSERT INTO words VALUES (?)", [(n,) for n in sorted(names)])
+        conn.executemany("INSERT INTO synsets VALUES (?, ?, ?)",
+                         [(i, s.name(), s.definition()) for s, i in synset_ids.items()])
+        conn.executemany("INSERT INTO lemmas VALUES (?, ?, ?)", lemma_rows)
+    conn.execute("VACUUM")
+    conn.close()
+    _store_connection.cache_clear()
+    return len(names), len(synset_ids)
+
+
+def parse_args():
+    parser = ArgumentParser(description="Build the offline WordNet tables")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    # The store is written where get_store() reads it
+    subparsers.add_parser(
+        "export", help=f"Local store of the Portuguese lemmas and synsets (in {store_path})")
+    ambiguity_parser = subparsers.add_parser(
+        "ambiguity",
+        help=f"Most distant definitions of every ambiguous lemma (in {ambiguity_table_path})")
+    ambiguity_parser.add_argument("-b", "--batch_size", type=int, default=256)
+    ambiguity_parser.add_argument("--workers", type=int, default=1,
+                                  help="Number of encoding processes")
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args()
+    if args.command == "export":
+        n_words, n_synsets = export_wordnet()
+        print(f"Saved {n_words} words and {n_synsets} synsets to {store_path}")
+    elif args.command == "ambiguity":
+        n_lemmas = build_ambiguity_table(batch_size=args.batch_size, workers=args.workers)
+        print(f"Saved {n_lemmas} lemmas to {ambiguity_table_path}")
+
+
+if __name__ == "__main__":
+    main()
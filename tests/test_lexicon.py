@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from full_pun_generation.lexicon import (Lexicon, NearHomophoneIndex,
+                                         PhonemeTrie, edit_distance)
+from full_pun_generation.pronunciation import encode_pronunciation
+
+pronunciations = {"entre": "ˈe~|t|ɾ|i", "miada": "m|i|ˈa|d|ɐ", "entremeada": "e~|t|ɾ|i|m|i|ˈa|d|ɐ",
+                  "mi": "m|ˈi", "ada": "ˈa|d|ɐ", "sol": "ˈs|ɔ|w", "sal": "ˈs|a|w",
+                  "sul": "ˈs|u|w", "soul": "ˈs|ɔ|w", "sola": "ˈs|ɔ|l|ɐ"}
+
+
+@pytest.fixture
+def lexicon():
+    return Lexicon(pronunciations, [encode_pronunciation(p) for p in pronunciations.values()])
+
+
+def test_edit_distance():
+    a, b = encode_pronunciation("ˈs|ɔ|w"), encode_pronunciation("ˈs|ɔ|l|ɐ")
+    assert edit_distance(a, a) == 0
+    assert edit_distance(a, b) == edit_distance(b, a) == 2
+    assert edit_distance(a, b, max_distance=1) == 2
+    assert edit_distance(a, encode_pronunciation("ˈs|ɔ|w|m|i|ˈa|d|ɐ"), max_distance=2) == 3
+
+
+def test_save_load_roundtrip(lexicon, tmp_path):
+    lexicon.save(tmp_path / "lexicon.npz")
+    loaded = Lexicon.load(tmp_path / "lexicon.npz")
+    assert loaded.words == lexicon.words
+    assert [loaded.pronunciation(i) for i in range(len(loaded))] == \
+        [lexicon.pronunciation(i) for i in range(len(lexicon))]
+
+
+def test_older_lexicon_is_rejected(lexicon, tmp_path):
+    np.savez(tmp_path / "lexicon.npz", words=np.array(lexicon.words), offsets=lexicon.offsets,
+             codes=lexicon.codes.astype(np.uint8), phonemes=np.array(["a"]))
+    with pytest.raises(RuntimeError, match="older"):
+        Lexicon.load(tmp_path / "lexicon.npz")
+
+
+@pytest.mark.parametrize("max_distance", [1, 2])
+def test_index_matches_brute_force(lexicon, max_distance):
+    index = NearHomophoneIndex(lexicon, max_distance)
+    for word in pronunciations:
+        query = encode_pronunciation(pronunciations[word])
+        expected = sorted(((other, d) for i, other in enumerate(lexicon.words)
+                           if (d := edit_distance(query, lexicon.pronunciation(i)))
+                           <= max_distance),
+                          key=lambda x: (x[1], x[0]))
+        assert index.query(query) == expected
+    assert index.query(encode_pronunciation("ˈs|ɔ|w"))[:2] == [("sol", 0), ("soul", 0)]
+    with pytest.raises(ValueError):
+        index.query(encode_pronunciation("ˈs|ɔ|w"), max_distance=max_distance + 1)
+
+
+def test_segmentations(lexicon):
+    trie = PhonemeTrie(lexicon)
+    # Stress is ignored when matching
+    segmentations = trie.segmentations(encode_pronunciation(pronunciations["entremeada"]))
+    assert segmentations == [("entre", "miada"), ("entre", "mi", "ada")]
+    assert trie.segmentations(encode_pronunciation(pronunciations["entremeada"]),
+                              max_words=2) == [("entre", "miada")]
+    assert trie.segmentations(encode_pronunciation(pronunciations["entremeada"]),
+                              limit=1) == [("entre", "miada")]
+    assert trie.segmentations(encode_pronunciation(pronunciations["sola"])) == []
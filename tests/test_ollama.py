@@ -0,0 +1,155 @@
+import importlib.util
+import json
+import threading
+import time
+import urllib.request
+from argparse import Namespace
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from full_pun_generation.ollama import (Dispatcher, JsonObjectScanner,
+                                        stream_generate)
+
+stub_path = Path(__file__).parents[1] / "scripts" / "benchmark" / "stub_ollama.py"
+spec = importlib.util.spec_from_file_location("stub_ollama", stub_path)
+stub_ollama = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(stub_ollama)
+
+
+@pytest.fixture
+def stub_servers():
+    """Start stub Ollama servers; each is (token delay, failing, down after seconds)."""
+    servers = list()
+
+    def start(*configs):
+        urls = list()
+        for token_delay, failing, down_after in configs:
+            server = ThreadingHTTPServer(("localhost", 0), None)
+            port = server.server_port
+            args = Namespace(token_delay=token_delay, slow_ports=[],
+                             fail_ports=[port] if failing else [], fail_rate=1.0,
+                             down_after=down_after)
+            server.RequestHandlerClass = stub_ollama.make_handler(args, port)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            urls.append(f"http://localhost:{port}")
+        return urls
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def generate(url, prompt):
+    request = urllib.request.Request(f"{url}/api/generate",
+                                     data=json.dumps({"prompt": prompt, "stream": False}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=5) as response:
+        return json.loads(response.read())["response"]
+
+
+def test_failed_requests_are_retried_on_another_endpoint(stub_servers):
+    good, failing = stub_servers((0.0, False, None), (0.0, True, None))
+    with Dispatcher([good, failing], lambda url: url, max_outstanding=2,
+                    errors=(OSError,)) as dispatcher:
+        results = dispatcher.map(generate, range(10))
+        report = dispatcher.report()
+    assert results == [stub_ollama.answer] * 10
+    assert report["completed"].to_list() == [10, 0]
+    assert report["failures"].to_list()[1] >= 1
+    assert report["healthy"].to_list() == [True, False]
+
+
+def test_other_errors_do_not_mark_endpoints_unhealthy(stub_servers):
+    urls = stub_servers((0.0, False, None))
+
+    def broken(url, item):
+        raise ValueError(item)
+
+    with Dispatcher(urls, lambda url: url, errors=(OSError,)) as dispatcher:
+        with pytest.raises(ValueError):
+            dispatcher.submit(broken, 1).result()
+        assert dispatcher.endpoints[0].healthy
+        assert dispatcher.endpoints[0].failures == 0
+        assert dispatcher.endpoints[0].outstanding == 0
+
+
+def test_no_healthy_endpoint_after_a_health_check(stub_servers):
+    urls = stub_servers((0.0, True, 0.0))
+    start = time.perf_counter()
+    with Dispatcher(urls, lambda url: url, health_interval=0.2,
+                    errors=(OSError,)) as dispatcher:
+        assert not dispatcher.endpoints[0].healthy
+        with pytest.raises(RuntimeError, match="No healthy"):
+            dispatcher.submit(generate, 1).result()
+    # It waited for the next health check before giving up
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_leaving_on_an_exception_cancels_pending_requests(stub_servers):
+    urls = stub_servers((0.01, False, None))
+    futures = list()
+    start = time.perf_counter()
+    with pytest.raises(KeyboardInterrupt):
+        with Dispatcher(urls, lambda url: url, max_outstanding=1,
+                        errors=(OSError,)) as dispatcher:
+            futures = [dispatcher.submit(generate, i) for i in range(20)]
+            time.sleep(0.1)
+            raise KeyboardInterrupt
+    assert time.perf_counter() - start < 20 * 0.01 * len(stub_ollama.tokens(stub_ollama.answer))
+    assert any(future.cancelled() for future in futures)
+
+
+def feed_all(scanner, chunks):
+    results = [scanner.feed(chunk) for chunk in chunks]
+    return next((r for r in results if r is not None), None)
+
+
+def test_scanner_skips_reasoning_and_other_objects():
+    joke = {"palavras": ["sol", "só"], "trocadilho": "Diz \\\"{sol}\\\" e {fica} só."}
+    text = 'Exemplo: {"outro": {"a": 1}} e ' + json.dumps(joke, ensure_ascii=False) + " fim"
+    chunks = ["<think>", "Algo como", ' {"palavras":', " []}", "</think>"] + \
+        [text[i:i + 3] for i in range(0, len(text), 3)]
+    scanner = JsonObjectScanner()
+    assert feed_all(scanner, chunks) == joke
+    assert scanner.reasoning_tokens == 5
+
+
+def test_scanner_without_reasoning():
+    scanner = JsonObjectScanner()
+    assert feed_all(scanner, ["<th", "e", ' {"palavras": [], "trocadilho": "x"}']) == \
+        {"palavras": [], "trocadilho": "x"}
+    assert scanner.reasoning_tokens == 0
+    assert feed_all(JsonObjectScanner(), ['{"palavras": [', "]"]) is None
+
+
+class FakeChain():
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+        self.streamed = 0
+
+    def stream(self, prompt_data):
+        try:
+            for chunk in self.chunks:
+                self.streamed += 1
+                yield chunk
+        finally:
+            self.closed = True
+
+
+@pytest.mark.parametrize("chunks, budget, reason, streamed, saved", [
+    (['{"palavras": [], ', '"trocadilho": "x"}', " depois"], None, "json", 2, 98),
+    (["<think>", "hmm"] * 5, 3, "reasoning budget", 4, 96),
+    (["sem", " objeto"], None, "end", 2, 0),
+])
+def test_stream_generate_stop_reasons(chunks, budget, reason, streamed, saved):
+    chain = FakeChain(chunks)
+    result = stream_generate(chain, {}, reasoning_budget=budget, max_tokens=100)
+    assert result["stop reason"] == reason
+    assert result["tokens"] == chain.streamed == streamed
+    assert result["tokens saved"] == saved
+    assert chain.closed
@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from full_pun_generation.pipeline import Pipeline, Stage, generation_stage
+
+
+def double(items):
+    return [2 * item for item in items]
+
+
+def test_map_keeps_order_and_batches():
+    with Pipeline([Stage("double", double, batch_size=4, max_wait=0.01),
+                   Stage("plus one", lambda items: [i + 1 for i in items], batch_size=8)]) as pipeline:
+        assert pipeline.map(range(20)) == [2 * i + 1 for i in range(20)]
+        report = pipeline.report()
+    assert report["items"].to_list() == [20, 20]
+    assert max(report["mean batch"].to_list()) > 1
+
+
+def test_failing_item_does_not_fail_its_batch():
+    def fail_on_three(items):
+        if 3 in items:
+            raise ValueError("three")
+        return double(items)
+
+    with Pipeline([Stage("fail", fail_on_three, batch_size=8, max_wait=0.05)]) as pipeline:
+        futures = [pipeline.submit(i) for i in range(6)]
+        for i, future in enumerate(futures):
+            if i == 3:
+                with pytest.raises(ValueError):
+                    future.result()
+            else:
+                assert future.result() == 2 * i
+        report = pipeline.report()
+    assert report["failures"].item() == 1
+    assert report["items"].item() == 5
+    assert report["retried batches"].item() >= 1
+
+
+def test_wrong_number_of_results_fails_the_items():
+    def drop_three(items):
+        return [2 * item for item in items if item != 3]
+
+    def duplicate_four(items):
+        return [i for item in items for i in [item] * (2 if item == 4 else 1)]
+
+    with Pipeline([Stage("drop", drop_three, batch_size=8, max_wait=0.05),
+                   Stage("duplicate", duplicate_four, batch_size=8, max_wait=0.05)]) as pipeline:
+        futures = [pipeline.submit(i) for i in range(5)]
+        with pytest.raises(RuntimeError, match="drop returned 0 results for 1 items"):
+            futures[3].result(timeout=5)
+        with pytest.raises(RuntimeError, match="duplicate returned 2 results for 1 items"):
+            futures[2].result(timeout=5)
+        assert [futures[i].result(timeout=5) for i in (0, 1, 4)] == [0, 2, 8]
+        report = pipeline.report()
+    assert report["failures"].to_list() == [1, 1]
+    assert report["items"].to_list() == [4, 3]
+
+
+def test_backpressure_and_non_blocking_submit():
+    release = threading.Event()
+
+    def wait(items):
+        release.wait()
+        return items
+
+    pipeline = Pipeline([Stage("wait", wait)], queue_size=2)
+    futures = [pipeline.submit(i) for i in range(3)]
+    # One item is being processed and two are queued
+    time.sleep(0.05)
+    with pytest.raises(queue.Full):
+        pipeline.submit(3, block=False)
+    release.set()
+    assert [future.result() for future in futures] == [0, 1, 2]
+    pipeline.close()
+
+
+def test_cancelled_items_are_dropped():
+    release = threading.Event()
+    seen = list()
+
+    def first(items):
+        release.wait()
+        return items
+
+    def second(items):
+        seen.extend(items)
+        return items
+
+    with Pipeline([Stage("first", first, batch_size=1), Stage("second", second)]) as pipeline:
+        futures = [pipeline.submit(i) for i in range(3)]
+        time.sleep(0.05)
+        assert futures[2].cancel()
+        assert futures[2].progress[0] == 0
+        release.set()
+        assert futures[1].result() == 1
+    assert seen == [0, 1]
+    assert futures[0].progress[0] == 1
+
+
+def test_generation_stage():
+    def generate(prompts):
+        return [f"{prompt['pun sign']}!" for prompt in prompts]
+
+    signs = [[["sol", "astro"], ["sol", "nota"]], [["mar", "oceano"], ["amar", "gostar"]]]
+    with Pipeline([generation_stage(generate, max_signs=1)]) as pipeline:
+        items = pipeline.map([{"signs": signs}, {"signs": []}])
+    assert [joke["joke"] for joke in items[0]["jokes"]] == ["sol!"]
+    assert items[0]["jokes"][0]["alternative definition"] == "nota"
+    assert items[1]["jokes"] == []
@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from full_pun_generation.pronunciation import (PhonemeInventory, get_graphemes,
+                                               inventory, p2g,
+                                               ranked_possibilities)
+
+
+def test_encode_decode_roundtrip():
+    codes = inventory.encode("k|ˈa|z|ɐ")
+    assert codes.typecode == 'H'
+    assert inventory.decode(codes) == (["k", "a", "z", "ɐ"], ["", "ˈ", "", ""])
+    assert inventory.decode(inventory.encode("ˌk|ˈa z|ɐ")) == \
+        (["k", "a", " ", "z", "ɐ"], ["ˌ", "ˈ", "", "", ""])
+
+
+def test_encoding_keeps_secondary_stress_and_separators():
+    codes = inventory.encode("k|ˈa|z|ɐ")
+    assert inventory.encode("ˌk|ˈa|z|ɐ") != codes
+    assert inventory.encode("k|ˈa z|ɐ") != codes
+    assert inventory.encode("k|ˈa|z|ɐ") == codes
+
+
+def test_p2g_ids_are_stable():
+    assert [inventory.intern(p) for p in p2g] == list(range(len(p2g)))
+    assert PhonemeInventory(p2g).encode("ˈs|o|l") == inventory.encode("ˈs|o|l")
+
+
+def test_full_inventory_raises():
+    full = PhonemeInventory(str(i) for i in range(PhonemeInventory.separator))
+    assert full.intern("0") == 0
+    with pytest.raises(RuntimeError, match="full"):
+        full.intern("x")
+
+
+def test_concurrent_interning_is_consistent():
+    shared = PhonemeInventory()
+    phonemes = [f"p{i}" for i in range(100)]
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: [shared.intern(p) for p in phonemes],
+                                    range(16)))
+    assert all(ids == results[0] for ids in results)
+    assert sorted(results[0]) == list(range(100))
+    assert [shared.phonemes[i] for i in results[0]] == phonemes
+
+
+def test_graphemes_merge_phonemes_across_words():
+    # The spelling rules see "k|s" as one phoneme, also across words, and
+    # ignore secondary stress
+    assert get_graphemes(inventory.encode("ˈt|a|k|s|i")) == \
+        get_graphemes(inventory.encode("ˈt|a|ks|i")) == \
+        get_graphemes(inventory.encode("ˈt|a|k ˌs|i"))
+    assert len(get_graphemes(inventory.encode("ˈt|a|k|ˈs|i"))) == 5
+
+
+def test_unknown_phonemes_have_no_graphemes():
+    assert get_graphemes(inventory.encode("ʔ|ʕ")) == [("-",), ("-",)]
+
+
+class CountingModel():
+    """Spelling model preferring short graphemes, counting the states it scores."""
+    def __init__(self):
+        self.scored = 0
+
+    def score(self, grapheme, prefix):
+        self.scored += 1
+        return -len(grapheme)
+
+    def log_prob(self, prefix, char):
+        return 0.0
+
+
+@pytest.mark.parametrize("max_states", [1, 5, 40, 10000])
+def test_ranked_possibilities_respects_max_states(max_states):
+    graphemes = [("s", "ss", "ç"), ("a", "á", "ha"), ("p", "pp"), ("o", "ô", "ho")] * 3
+    model = CountingModel()
+    writings = ranked_possibilities(graphemes, beam_size=10, max_states=max_states, model=model)
+    assert model.scored <= max(max_states, len(graphemes))
+    assert writings
+    assert all(len(w) >= len(graphemes) for w in writings)
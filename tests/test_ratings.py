@@ -0,0 +1,58 @@
+import polars as pl
+
+from full_pun_generation.ratings import (RatingsStore, load_results,
+                                         read_results_file, record_schema)
+
+
+def rating(evaluator="ana", headline_id=1, model="ptt5-v2", generated="Uma piada.",
+           funniness="Tem piada", relation="Tem relação"):
+    return {"headline_id": headline_id, "model": model, "headline": "Manchete",
+            "pun sign": "sol", "alternative sign": "sol", "generated": generated,
+            "similarity": 0.5, "typicality": 0.5, "score": 0.5,
+            "evaluator": evaluator, "funniness": funniness, "relation": relation}
+
+
+def test_upsert_updates_existing_rating(tmp_path):
+    store = RatingsStore(tmp_path / "results.db")
+    store.upsert([rating(), rating(headline_id=2)])
+    store.upsert([rating(funniness="Não tem piada")])
+    df = store.query()
+    assert df.height == 2
+    assert df["headline_id"].to_list() == [1, 2]
+    assert df.filter(pl.col("headline_id") == 1)["funniness"].item() == "Não tem piada"
+
+
+def test_query_filters(tmp_path):
+    store = RatingsStore(tmp_path / "results.db")
+    store.upsert([rating(), rating(evaluator="bia"), rating(model="llama3-3")])
+    assert store.query(evaluator="bia").height == 1
+    assert store.query(model="ptt5-v2").height == 2
+    assert store.query(evaluator="ana", model="llama3-3", headline_id=1).height == 1
+    assert store.evaluators() == ["ana", "bia"]
+
+
+def test_empty_query_has_full_schema(tmp_path):
+    store = RatingsStore(tmp_path / "results.db")
+    assert store.is_empty()
+    df = store.query()
+    assert df.height == 0
+    assert df.schema == pl.Schema(record_schema)
+
+
+def test_jsonl_keeps_latest_rating(tmp_path):
+    pl.DataFrame([rating(), rating(headline_id=2), rating(funniness="Não tem piada")]
+                 ).write_ndjson(tmp_path / "ana.jsonl")
+    df = read_results_file(tmp_path / "ana.jsonl")
+    assert df.height == 2
+    assert df.filter(pl.col("headline_id") == 1)["funniness"].item() == "Não tem piada"
+    assert load_results(tmp_path).height == 2
+
+
+def test_export_import_roundtrip(tmp_path):
+    store = RatingsStore(tmp_path / "results.db")
+    store.upsert([rating(), rating(evaluator="bia", relation="Não tem relação")])
+    store.export_jsonl(tmp_path)
+    copy = RatingsStore(tmp_path / "copy.db")
+    copy.import_jsonl(tmp_path)
+    assert copy.query().sort("evaluator").equals(store.query().sort("evaluator"))
+    assert load_results(tmp_path).height == 2
@@ -0,0 +1,39 @@
+import json
+
+from full_pun_generation.results import ingest, scan_results
+
+
+def write_generations(path, jokes):
+    with open(path, "w") as f:
+        for i, joke in enumerate(jokes):
+            generated = json.dumps({"palavras": ["sol", "sol"], "trocadilho": joke})
+            f.write(json.dumps({"id": i, "headline": "Manchete", "pun sign": "sol",
+                                "alternative sign": "sol", "generated": generated}) + "\n")
+
+
+def test_unscored_ingest(tmp_path):
+    results_path, store = tmp_path / "generation", tmp_path / "store"
+    results_path.mkdir()
+    write_generations(results_path / "llama3-3_fewshot.jsonl", ["Uma piada.", "Outra."])
+
+    partitions = ingest(results_path, store, score=False)
+    assert [p.name.endswith("-unscored.parquet") for p in partitions] == [True]
+    assert ingest(results_path, store, score=False) == []
+
+    df = scan_results(store).collect()
+    assert df["generated"].to_list() == ["Uma piada.", "Outra."]
+    assert df["few shot"].all() and df["similarity"].is_null().all()
+
+    # A new version of the file replaces the old partition
+    write_generations(results_path / "llama3-3_fewshot.jsonl", ["Nova piada."])
+    assert len(ingest(results_path, store, score=False)) == 1
+    assert scan_results(store).collect()["generated"].to_list() == ["Nova piada."]
+
+
+def test_scored_partition_serves_unscored_ingest(tmp_path):
+    results_path, store = tmp_path / "generation", tmp_path / "store"
+    results_path.mkdir()
+    write_generations(results_path / "ptt5-v2.jsonl", ["Uma piada."])
+    [partition] = ingest(results_path, store, score=False)
+    partition.rename(partition.with_name(partition.name.replace("-unscored", "")))
+    assert ingest(results_path, store, score=False) == []
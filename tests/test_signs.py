@@ -0,0 +1,69 @@
+import os
+import time
+
+import full_pun_generation.lexicon as lexicon
+from full_pun_generation.signs import SignsCache, signs_namespace
+
+
+def test_namespace_follows_lexicon(tmp_path, monkeypatch):
+    lexicon_path = tmp_path / "lexicon.npz"
+    monkeypatch.setattr(lexicon, "lexicon_path", lexicon_path)
+    without = signs_namespace()
+    assert without.endswith("-nolex")
+
+    lexicon_path.write_bytes(b"lexicon")
+    built = signs_namespace()
+    assert built != without
+    assert signs_namespace() == built
+
+    os.utime(lexicon_path, ns=(0, 10**9))
+    assert signs_namespace() not in (without, built)
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_cache_counts_hits_and_misses(tmp_path):
+    cache = SignsCache(tmp_path / "signs.db")
+    cache.put_many("expansion", {"sol": ["sol", "lua"], "mar": ["mar"]})
+    assert cache.get_many("expansion", ["sol", "céu", "sol"]) == {"sol": ["sol", "lua"]}
+    assert cache.get_many("signs", ["sol"]) == {}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["hits"] == {"expansion": 1, "signs": 0} and stats["misses"] == {"expansion": 1, "signs": 1}
+    assert stats["hit rate"] == {"expansion": 0.5, "signs": 0.0}
+    # Entries persist across instances
+    assert SignsCache(tmp_path / "signs.db").get_many("expansion", ["mar"]) == {"mar": ["mar"]}
+
+
+def test_cache_expires_entries(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    cache = SignsCache(tmp_path / "signs.db", ttl=60)
+    cache.put_many("expansion", {"sol": ["sol"]})
+    clock.now += 59
+    assert cache.get_many("expansion", ["sol"]) == {"sol": ["sol"]}
+    clock.now += 2
+    assert cache.get_many("expansion", ["sol"]) == {}
+    cache.put_many("expansion", {"mar": ["mar"]})
+    assert len(cache) == 1 and cache.evictions == 1
+
+
+def test_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    cache = SignsCache(tmp_path / "signs.db", max_entries=2)
+    cache.put_many("expansion", {"sol": ["sol"]})
+    clock.now += 1
+    cache.put_many("expansion", {"mar": ["mar"]})
+    clock.now += 1
+    cache.get_many("expansion", ["sol"])
+    clock.now += 1
+    cache.put_many("expansion", {"céu": ["céu"]})
+    assert cache.get_many("expansion", ["sol", "mar", "céu"]).keys() == {"sol", "céu"}
+    assert cache.evictions == 1
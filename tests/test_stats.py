@@ -0,0 +1,73 @@
+import numpy as np
+import polars as pl
+import pytest
+
+from full_pun_generation.stats import (agreement_summary, bootstrap_alpha,
+                                       category_counts, holm, median,
+                                       ordinal_alpha, reliability_data,
+                                       tastle_wierman_consensus)
+
+nan = np.nan
+# Reliability data of Krippendorff (2011), "Computing Krippendorff's
+# alpha-reliability": 4 observers (rows) rating 12 units on a 1-5 scale
+krippendorff_data = np.array([[1, 2, 3, 3, 2, 1, 4, 1, 2, nan, nan, nan],
+                              [1, 2, 3, 3, 2, 2, 4, 1, 2, 5, nan, 3],
+                              [nan, 3, 3, 3, 2, 3, 4, 2, 2, 5, 1, nan],
+                              [1, 2, 3, 3, 2, 4, 4, 1, 2, 5, 1, nan]])
+scale = [1, 2, 3, 4, 5]
+
+
+def test_ordinal_alpha_known_value():
+    counts = category_counts(krippendorff_data.T, scale)
+    assert ordinal_alpha(counts) == pytest.approx(0.815, abs=5e-4)
+
+
+def test_ordinal_alpha_over_groups():
+    counts = category_counts(krippendorff_data.T, scale)
+    perfect = category_counts(np.tile(np.arange(12.0) % 5 + 1, (4, 1)).T, scale)
+    alphas = ordinal_alpha(np.stack([counts, perfect]))
+    assert alphas == pytest.approx([0.8154, 1.0], abs=1e-4)
+
+
+def test_consensus_known_values():
+    # Ratings 0, 0, 1, 2, 2: mean 1, width 2, so 1 + 0.8 * log2(1/2)
+    assert tastle_wierman_consensus(np.array([2, 1, 2]), [0, 1, 2]) == pytest.approx(0.2)
+    # Full agreement
+    assert tastle_wierman_consensus(np.array([[0, 3, 0], [0, 0, 4]]), [0, 1, 2]) \
+        == pytest.approx([1.0, 1.0])
+
+
+def test_median():
+    assert median(np.array([[2, 1, 2], [0, 1, 3], [3, 0, 0]]), [0, 1, 2]).tolist() == [1, 2, 0]
+
+
+def test_reliability_data_layout():
+    df = pl.DataFrame({"model": ["a", "a", "b"], "evaluator": ["x", "y", "x"],
+                       "headline_id": [1, 1, 2], "funniness": [1, 2, None]})
+    data, groups, raters, items = reliability_data(df, "funniness")
+    assert data.shape == (1, 2, 1)
+    assert groups.tolist() == ["a"] and raters.tolist() == ["x", "y"]
+    assert data[0, :, 0].tolist() == [1, 2]
+
+
+def test_bootstrap_does_not_depend_on_workers():
+    counts = category_counts(krippendorff_data.T, scale)
+    one = bootstrap_alpha(counts, n_resamples=300, seed=1, workers=1, chunk_size=100)
+    four = bootstrap_alpha(counts, n_resamples=300, seed=1, workers=4, chunk_size=100)
+    assert one == four
+    assert one[0] < ordinal_alpha(counts) < one[1]
+
+
+def test_agreement_summary():
+    rows = [{"model": model, "evaluator": f"e{rater}", "headline_id": unit,
+             "funniness": int(value)}
+            for model in ["a", "b"]
+            for rater, ratings in enumerate(krippendorff_data)
+            for unit, value in enumerate(ratings) if not np.isnan(value)]
+    summary = agreement_summary(pl.DataFrame(rows), ["funniness"], scale, n_resamples=0)
+    assert summary["model"].to_list() == ["a", "b"]
+    assert summary["funniness alpha"].to_list() == pytest.approx([0.8154] * 2, abs=1e-4)
+
+
+def test_holm():
+    assert holm([0.01, 0.04, 0.03]).tolist() == pytest.approx([0.03, 0.06, 0.06])